@@ -37,5 +37,14 @@ model = ChatGoogleGenerativeAI(
     model="gemini-2.0-flash",
     google_api_key=gemini_api_key,
     temperature=0.5,
+    # A single attempt per call; app.services.llm retries so retries can be counted
+    max_retries=1,
 )
-logger.info("Gemini model initialized") 
\ No newline at end of file
+logger.info("Gemini model initialized")
+
+# Cap on in-flight LLM calls per process; extra calls wait for a free slot
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+
+# Retries of failed or unparsable LLM calls, with exponential backoff from LLM_RETRY_BACKOFF seconds
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", 0.5))
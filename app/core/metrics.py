@@ -0,0 +1,164 @@
+import re
+import time
+from functools import wraps
+from typing import Callable, Dict, FrozenSet, NamedTuple, Optional, Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# LLM calls take seconds, so the default buckets (up to 10s) are too short
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "crypto_agent_http_request_duration_seconds",
+    "Backend HTTP requests by route, method and status; streamed responses count until their last chunk",
+    ["route", "method", "status"]
+)
+NODE_DURATION = Histogram(
+    "crypto_agent_node_duration_seconds",
+    "Time spent in each LangGraph node",
+    ["node", "outcome"]
+)
+LLM_DURATION = Histogram(
+    "crypto_agent_llm_duration_seconds",
+    "Duration of each LLM attempt, excluding the wait for a concurrency slot",
+    ["call", "outcome"],
+    buckets=LLM_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "crypto_agent_llm_tokens",
+    "Tokens reported by the LLM",
+    ["call", "direction"]
+)
+LLM_RETRIES = Counter(
+    "crypto_agent_llm_retries",
+    "LLM calls retried after an error or an unparsable answer",
+    ["call"]
+)
+SERVICE_REQUEST_DURATION = Histogram(
+    "crypto_agent_coingecko_request_duration_seconds",
+    "Requests to the CoinGecko service by endpoint, status and the service's X-Cache result",
+    ["endpoint", "status", "cache"]
+)
+
+def instrument_node(name: str, node: Callable) -> Callable:
+    """Wrap an async LangGraph node so its duration is recorded under ``name``.
+
+    ``wraps`` keeps the node's signature visible, so LangGraph still passes
+    ``config`` to the nodes that take it.
+    """
+    @wraps(node)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await node(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            NODE_DURATION.labels(name, outcome).observe(time.perf_counter() - started)
+    return wrapper
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template.
+
+    Paths that match no route share one label, so scanners cannot blow up
+    the number of series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                route.path if route else "unmatched", scope["method"], status
+            ).observe(time.perf_counter() - started)
+
+def _label_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+class StatsFields(NamedTuple):
+    """How the string fields of ``stats()`` dicts are exported."""
+    # Fields identifying a list item, exported as labels
+    labels: FrozenSet[str] = frozenset()
+    # Fields holding a state, by name, with every state they can take
+    states: Dict[str, Tuple[str, ...]] = {}
+
+def _flatten(prefix: str, stats: dict, labels: Dict[str, str], samples: dict, fields: "StatsFields") -> None:
+    """Collect the numbers in ``stats`` as ``{metric: [(labels, value)]}``.
+
+    Nested dicts extend the metric name (``acquired_user``). Only identity
+    fields (``fields.labels``) become labels of their numeric siblings, so
+    each item of a list (a replica, say) gets its own series of the
+    parent's metrics. A state field becomes one 0/1 gauge per known state
+    (``circuit_open``), so a state change never starts a new series; other
+    strings are not exported.
+    """
+    labels = {**labels, **{
+        _label_name(key): value for key, value in stats.items() if key in fields.labels and isinstance(value, str)
+    }}
+    for key, value in stats.items():
+        name = f"{prefix}_{_label_name(key)}"
+        if isinstance(value, str):
+            for state in fields.states.get(key, ()):
+                samples.setdefault(f"{name}_{_label_name(state)}", []).append((labels, float(value == state)))
+        elif isinstance(value, (bool, int, float)):
+            samples.setdefault(name, []).append((labels, float(value)))
+        elif isinstance(value, dict):
+            _flatten(name, value, labels, samples, fields)
+        elif isinstance(value, list):
+            # Items are series of the parent's metrics: replicas -> coingecko_replicas_requests{url=...}
+            for item in value:
+                if isinstance(item, dict):
+                    _flatten(prefix, item, labels, samples, fields)
+
+class StatsCollector:
+    """Expose the ``stats()`` dicts behind ``/stats`` as gauges at scrape time.
+
+    The counters are already kept for ``/stats``, so requests pay nothing
+    extra for them; sources returning None (a disabled feature) are skipped.
+    """
+
+    def __init__(self, namespace: str, sources: Dict[str, Callable[[], Optional[dict]]], fields: StatsFields):
+        self.namespace = namespace
+        self.sources = sources
+        self.fields = fields
+
+    def collect(self):
+        samples = {}
+        for source, stats in self.sources.items():
+            value = stats()
+            if value is not None:
+                _flatten(f"{self.namespace}_{source}", value, {}, samples, self.fields)
+        for name, series in samples.items():
+            label_names = sorted({label for labels, _ in series for label in labels})
+            family = GaugeMetricFamily(name, f"{name} from /stats", labels=label_names)
+            for labels, value in series:
+                family.add_metric([labels.get(label, "") for label in label_names], value)
+            yield family
+
+def register_stats(
+    namespace: str,
+    sources: Dict[str, Callable[[], Optional[dict]]],
+    fields: StatsFields = StatsFields()
+) -> None:
+    REGISTRY.register(StatsCollector(namespace, sources, fields))
+
+def render_metrics() -> tuple:
+    """Body and content type of a ``/metrics`` response."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
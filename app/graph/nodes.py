@@ -1,92 +1,362 @@
+import asyncio
 import json
-from app.core.config import model, logger
+import os
+from typing import List, Optional, Tuple
+from app.core.config import logger
 from app.graph.state import (
     CryptoAgentState,
+    CoinFetchState,
+    CoinCandidates,
     CryptoReflection,
     CryptoAgentOutput,
     QueryAnalysis,
     ResponseFormat
 )
-from app.services.coingecko import get_crypto_price, get_historical_price
-from app.prompts.templates import QUERY_ANALYSIS_PROMPT, COIN_REFLECTION_PROMPT
+from app.services.coingecko import (
+    get_crypto_price, get_crypto_prices, get_historical_price, historical_freshness, price_freshness
+)
+from app.services.analytics import summarize_history
+from app.services.downsample import downsample_chart
+from app.services.llm import invoke_structured, stream_text
+from app.services.resolver import resolver, COIN_FUZZY_THRESHOLD
+from app.services.query_parser import parse_query as parse_query_rules
+from app.services.query_cache import get_cached_analysis
+from app.prompts.templates import (
+    QUERY_ANALYSIS_PROMPT,
+    COIN_REFLECTION_PROMPT,
+    COIN_CANDIDATES_PROMPT,
+    PRICE_RESPONSE_TEMPLATE,
+    HISTORICAL_RESPONSE_TEMPLATE,
+    PRICE_COMPARISON_TEMPLATE,
+    HISTORICAL_COMPARISON_TEMPLATE
+)
 from fastapi import HTTPException
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
+
+# How format_response writes the answer: "llm" always asks the model,
+# "template" never does, "auto" uses templates for queries the fast path parsed
+RESPONSE_FORMAT_MODE = os.getenv("RESPONSE_FORMAT_MODE", "auto").lower()
+
+# Fetches per coin, including the first, before giving up on it
+MAX_FETCH_ATTEMPTS = 3
+
+# How a failed coin ID is corrected: "parallel" verifies a ranked list of
+# candidates in one batched lookup, "sequential" fetches one suggestion at a time
+REFLECTION_MODE = os.getenv("REFLECTION_MODE", "parallel").lower()
+# Candidates the LLM may add to the resolver's in parallel mode
+REFLECTION_CANDIDATES = int(os.getenv("REFLECTION_CANDIDATES", 5))
+
+async def parse_query(state: CryptoAgentState) -> CryptoAgentState:
+    """Parse simple queries with rules so they can skip the LLM analyzer"""
+    analysis = parse_query_rules(state.query)
+    if analysis is None:
+        logger.info(f"Fast path missed, falling back to LLM analysis: {state.query}")
+        return {"fast_path": False}
+    
+    logger.info(f"Query parsed by fast path: {analysis}")
+    return {
+        "coin_id": analysis.coin_id,
+        "coin_ids": analysis.coin_ids,
+        "query_type": analysis.query_type,
+        "days": analysis.days,
+        "coin_attempts": [analysis.coin_id],
+        "fast_path": True
+    }
 
 async def analyze_query(state: CryptoAgentState) -> CryptoAgentState:
     """Analyze the user query to extract coin and query type"""
+    # An earlier run may already have resolved the same question
+    cached = await get_cached_analysis(state.query)
+    if cached:
+        logger.info(f"Using cached analysis: {cached}")
+        return {**cached, "coin_attempts": [cached["coin_id"]]}
+
     logger.info(f"Analyzing query: {state.query}")
     
     # Use structured output for query analysis
-    analyzer = model.with_structured_output(QueryAnalysis)
-    analysis = analyzer.invoke([HumanMessage(content=QUERY_ANALYSIS_PROMPT.format(query=state.query))])
+    analysis = await invoke_structured(
+        QueryAnalysis,
+        [HumanMessage(content=QUERY_ANALYSIS_PROMPT.format(query=state.query))]
+    )
     logger.info(f"Query analyzed: {analysis}")
     
     if not analysis.coin_id:
         logger.error("No coin_id found in analysis")
         raise HTTPException(status_code=400, detail="Could not identify cryptocurrency in query")
     
+    # Map tickers and near-misses (e.g. "doge") to the CoinGecko id up front
+    coin_id = resolver.resolve(analysis.coin_id) or analysis.coin_id
+    if coin_id != analysis.coin_id:
+        logger.info(f"Resolved coin_id {analysis.coin_id} -> {coin_id}")
+    
+    coin_ids = []
+    for requested in analysis.coin_ids:
+        resolved = resolver.resolve(requested) or requested
+        if resolved not in coin_ids:
+            coin_ids.append(resolved)
+    
     return {
-        "coin_id": analysis.coin_id,
+        "coin_id": coin_id,
+        "coin_ids": coin_ids if len(coin_ids) > 1 else [],
         "query_type": analysis.query_type,
         "days": analysis.days,
-        "coin_attempts": [analysis.coin_id]
+        "coin_attempts": [coin_id]
     }
 
+async def get_spot_price(coin_id: str, prices: dict) -> Optional[dict]:
+    """Spot price of a coin, taken from the batch's prefetched prices when it is there"""
+    if coin_id in prices:
+        return {coin_id: prices[coin_id]}
+    return await get_crypto_price(coin_id)
+
 async def fetch_data(state: CryptoAgentState) -> CryptoAgentState:
     """Fetch price or historical data"""
     logger.info(f"Fetching data for coin: {state.coin_id}")
     
     if state.query_type == "price":
-        data = await get_crypto_price(state.coin_id)
+        data = await get_spot_price(state.coin_id, state.prices)
         logger.info(f"Data fetched: {data}")
         if data:
-            return {"current_price": data}
+            return {"current_price": data, "fresh_for": price_freshness(state.coin_id)}
     else:
+        # Full resolution for the analytics node, which downsamples afterwards
         data = await get_historical_price(state.coin_id, state.days)
-        logger.info(f"Historical data fetched: {data}")
         if data:
-            return {"historical_price": data}
+            logger.info(f"Historical data fetched: {len(data.get('prices', []))} price points")
+            return {"historical_price": data, "fresh_for": historical_freshness(state.coin_id, state.days)}
     
     return {
         "retry_count": state.retry_count + 1
     }
 
-async def reflect_on_coin(state: CryptoAgentState) -> CryptoAgentState:
-    """Reflect on failed data fetch and suggest new coin ID format"""
-    logger.info(f"Reflecting on failed attempt for coin: {state.coin_id}")
+async def compute_analytics(state: CryptoAgentState) -> CryptoAgentState:
+    """Summarize historical data so the formatter gets a few numbers instead of raw points"""
+    analytics = summarize_history(state.historical_price)
+    logger.info(f"Analytics computed: {analytics}")
     
-    # Filter out any None values from previous attempts
-    valid_attempts = [attempt for attempt in state.coin_attempts if attempt]
+    update = {"analytics": analytics}
+    if state.max_points:
+        update["historical_price"] = downsample_chart(state.historical_price, state.max_points)
+    return update
+
+async def suggest_coin_id(query: str, coin_id: str, attempts: List[str], retry_count: int) -> Optional[str]:
+    """Next coin ID to try after ``coin_id`` failed, or None to give up"""
+    # Try the local coin index before asking the LLM
+    for candidate, score in resolver.candidates(coin_id):
+        if candidate not in attempts and score >= COIN_FUZZY_THRESHOLD:
+            logger.info(f"Resolver suggested {candidate} for {coin_id} (score {score:.2f})")
+            return candidate
     
     # Use structured output for reflection
-    reflector = model.with_structured_output(CryptoReflection)
-    reflection = reflector.invoke([HumanMessage(content=COIN_REFLECTION_PROMPT.format(
-            query=state.query,
-            coin_id=state.coin_id,
-            attempt_count=state.retry_count,
-            previous_attempts=", ".join(valid_attempts)
+    reflection = await invoke_structured(CryptoReflection, [HumanMessage(content=COIN_REFLECTION_PROMPT.format(
+            query=query,
+            coin_id=coin_id,
+            attempt_count=retry_count,
+            previous_attempts=", ".join(attempts)
         ))
     ])
     logger.info(f"Reflection result: {reflection}")
     
     if reflection.sufficient:
-        return {"retry_count": 3}
+        return None
     
     if not reflection.refined_coin_id:
         logger.error("No refined_coin_id provided in reflection")
-        return {"retry_count": 3}
+        return None
+    
+    return reflection.refined_coin_id
+
+async def verify_candidates(candidates: List[str]) -> Optional[Tuple[str, dict]]:
+    """The first candidate the service knows, with its price, from one batched lookup"""
+    if not candidates:
+        return None
+    prices = await get_crypto_prices(candidates) or {}
+    for candidate in candidates:
+        if candidate in prices:
+            return candidate, {candidate: prices[candidate]}
+    return None
+
+async def rank_candidates(query: str, coin_id: str, attempts: List[str]) -> List[str]:
+    """Coin IDs the LLM thinks the query meant, best first"""
+    ranking = await invoke_structured(CoinCandidates, [HumanMessage(content=COIN_CANDIDATES_PROMPT.format(
+            query=query,
+            coin_id=coin_id,
+            previous_attempts=", ".join(attempts),
+            limit=REFLECTION_CANDIDATES
+        ))
+    ])
+    logger.info(f"Candidate ranking: {ranking}")
+    return ranking.candidates
+
+async def probe_candidates(query: str, coin_id: str, attempts: List[str]) -> Optional[Tuple[str, dict]]:
+    """Find a valid ID for a failed coin in a single round.
+
+    The resolver's close matches are verified while the LLM ranks its own
+    candidates; if none of them exists, the LLM's are verified together in
+    one more batched lookup. Returns the winning ID with its price.
+    """
+    ranking = asyncio.create_task(rank_candidates(query, coin_id, attempts))
+    try:
+        local = [
+            candidate for candidate, score in resolver.candidates(coin_id)
+            if candidate not in attempts and score >= COIN_FUZZY_THRESHOLD
+        ]
+        found = await verify_candidates(local)
+        if found:
+            logger.info(f"Resolver candidate {found[0]} verified for {coin_id}")
+            return found
+        
+        candidates = []
+        for suggested in await ranking:
+            candidate = resolver.resolve(suggested) or suggested.strip().lower()
+            if candidate and candidate not in attempts + local + candidates:
+                candidates.append(candidate)
+        found = await verify_candidates(candidates[:REFLECTION_CANDIDATES])
+        logger.info(f"Verified {found[0] if found else 'none'} of candidates {candidates} for {coin_id}")
+        return found
+    finally:
+        # Not needed once a resolver candidate has won
+        ranking.cancel()
+
+async def reflect_on_coin(state: CryptoAgentState) -> CryptoAgentState:
+    """Reflect on failed data fetch and suggest new coin ID format"""
+    logger.info(f"Reflecting on failed attempt for coin: {state.coin_id}")
+    
+    # Filter out any None values from previous attempts
+    valid_attempts = [attempt for attempt in state.coin_attempts if attempt]
+    
+    if REFLECTION_MODE == "parallel":
+        found = await probe_candidates(state.query, state.coin_id, valid_attempts)
+        if not found:
+            return {"retry_count": MAX_FETCH_ATTEMPTS}
+        coin_id, price = found
+        update = {"coin_id": coin_id, "coin_attempts": valid_attempts + [coin_id]}
+        # The verifying lookup already fetched the answer to a price query
+        if state.query_type == "price":
+            update["current_price"] = price
+            update["fresh_for"] = price_freshness(coin_id)
+        return update
+    
+    coin_id = await suggest_coin_id(state.query, state.coin_id, valid_attempts, state.retry_count)
+    if not coin_id:
+        return {"retry_count": MAX_FETCH_ATTEMPTS}
     
     return {
-        "coin_id": reflection.refined_coin_id,
-        "coin_attempts": valid_attempts + [reflection.refined_coin_id]
+        "coin_id": coin_id,
+        "coin_attempts": valid_attempts + [coin_id]
     }
 
-async def format_response(state: CryptoAgentState) -> CryptoAgentOutput:
+async def fetch_coin_data(state: CoinFetchState, coin_id: str) -> Optional[dict]:
+    if state["query_type"] == "price":
+        return await get_spot_price(coin_id, state.get("prices") or {})
+    return await get_historical_price(coin_id, state["days"])
+
+async def fetch_coin(state: CoinFetchState) -> CryptoAgentState:
+    """Fetch one coin of a multi-coin query, reflecting on its ID like the single-coin path.
+
+    Runs once per coin in parallel; each run appends one entry to
+    ``coin_results``.
+    """
+    requested = coin_id = state["coin_id"]
+    attempts = [coin_id]
+    logger.info(f"Fetching data for coin: {coin_id}")
+    
+    data = await fetch_coin_data(state, coin_id)
+    if not data and REFLECTION_MODE == "parallel":
+        found = await probe_candidates(state["query"], coin_id, attempts)
+        if found:
+            coin_id, data = found
+            if state["query_type"] == "historical":
+                data = await get_historical_price(coin_id, state["days"])
+    
+    retry_count = 1
+    while not data and REFLECTION_MODE != "parallel" and retry_count < MAX_FETCH_ATTEMPTS:
+        suggestion = await suggest_coin_id(state["query"], coin_id, attempts, retry_count)
+        if not suggestion:
+            break
+        coin_id = suggestion
+        attempts.append(coin_id)
+        data = await fetch_coin_data(state, coin_id)
+        retry_count += 1
+    
+    result = {"requested": requested, "coin_id": coin_id, "data": data}
+    if data and state["query_type"] == "historical":
+        result["analytics"] = summarize_history(data)
+        result["data"] = downsample_chart(data, state["max_points"])
+        result["fresh_for"] = historical_freshness(coin_id, state["days"])
+    elif data:
+        result["fresh_for"] = price_freshness(coin_id)
+    logger.info(f"Fetched {coin_id} for {requested}: {'found' if data else 'not found'}")
+    return {"coin_results": [result]}
+
+def use_template(state: CryptoAgentState) -> bool:
+    """Whether the answer can come from a template instead of the LLM"""
+    if RESPONSE_FORMAT_MODE == "template":
+        return True
+    if RESPONSE_FORMAT_MODE == "auto":
+        return state.fast_path
+    return False
+
+def format_usd(value: float) -> str:
+    """Dollar amount with cents, or significant digits for sub-dollar coins"""
+    if abs(value) >= 1:
+        return f"${value:,.2f}"
+    return f"${value:.6g}"
+
+def coin_label(coin_id: str) -> str:
+    name = resolver.name(coin_id) or coin_id
+    symbol = resolver.symbol(coin_id)
+    return f"{name} ({symbol.upper()})" if symbol else name
+
+def render_price_template(context: dict) -> str:
+    change = context["change_24h"]
+    market_cap = context["market_cap"]
+    return PRICE_RESPONSE_TEMPLATE.format(
+        coin=coin_label(context["coin"]),
+        price=format_usd(context["price"]),
+        change=f", {'up' if change >= 0 else 'down'} {abs(change):.2f}% in the last 24 hours" if change else "",
+        market_cap=f", with a market cap of ${market_cap:,.0f}" if market_cap else ""
+    )
+
+def render_historical_template(context: dict) -> str:
+    start, end = context["price_range"]["start"], context["price_range"]["end"]
+    change = (end - start) / start * 100 if start else 0.0
+    days = context["days"] or 1
+    analytics = context.get("analytics")
+    return HISTORICAL_RESPONSE_TEMPLATE.format(
+        days=days,
+        day_word="day" if days == 1 else "days",
+        coin=coin_label(context["coin"]),
+        start=format_usd(start),
+        end=format_usd(end),
+        change=f"{'up' if change >= 0 else 'down'} {abs(change):.2f}%",
+        price_range=(
+            f", trading between {format_usd(analytics['low']['price'])} and {format_usd(analytics['high']['price'])}"
+            if analytics else ""
+        ),
+        data_points=context["data_points"]
+    )
+
+async def write_response(prompt: str, config: RunnableConfig) -> str:
+    """Ask the LLM for the answer, streaming its tokens to the caller when requested"""
+    messages = [HumanMessage(content=prompt)]
+    if not config.get("configurable", {}).get("stream_tokens"):
+        response = await invoke_structured(ResponseFormat, messages)
+        return response.result
+    
+    writer = get_stream_writer()
+    chunks = []
+    async for chunk in stream_text(messages):
+        chunks.append(chunk)
+        writer({"token": chunk})
+    return "".join(chunks)
+
+async def format_response(state: CryptoAgentState, config: RunnableConfig) -> CryptoAgentOutput:
     """Format the final response"""
     logger.info("Formatting final response")
     
-    formatter = model.with_structured_output(ResponseFormat)
-    
     if state.current_price:
         price_data = state.current_price[state.coin_id]
         context = {
@@ -96,11 +366,17 @@ async def format_response(state: CryptoAgentState) -> CryptoAgentOutput:
             "change_24h": price_data.get("usd_24h_change", 0),
             "market_cap": price_data.get("usd_market_cap", 0)
         }
-        response = formatter.invoke(
-            [HumanMessage(content=f"Format a response for the query: {state.query}\nPrice data: {json.dumps(context)}")]
+        if use_template(state):
+            return {
+                "result": render_price_template(context),
+                "data": state.current_price
+            }
+        result = await write_response(
+            f"Format a response for the query: {state.query}\nPrice data: {json.dumps(context)}",
+            config
         )
         return {
-            "result": response.result,
+            "result": result,
             "data": state.current_price
         }
     elif state.historical_price:
@@ -108,17 +384,24 @@ async def format_response(state: CryptoAgentState) -> CryptoAgentOutput:
             "query": state.query,
             "coin": state.coin_id,
             "days": state.days,
-            "data_points": len(state.historical_price["prices"]),
+            "data_points": state.analytics["data_points"] if state.analytics else len(state.historical_price["prices"]),
             "price_range": {
                 "start": state.historical_price["prices"][0][1],
                 "end": state.historical_price["prices"][-1][1]
-            }
+            },
+            "analytics": state.analytics
         }
-        response = formatter.invoke(
-            [HumanMessage(content=f"Format a response for the query: {state.query}\nHistorical data: {json.dumps(context)}")]
+        if use_template(state):
+            return {
+                "result": render_historical_template(context),
+                "data": state.historical_price
+            }
+        result = await write_response(
+            f"Format a response for the query: {state.query}\nHistorical data: {json.dumps(context)}",
+            config
         )
         return {
-            "result": response.result,
+            "result": result,
             "data": state.historical_price
         }
     else:
@@ -127,4 +410,97 @@ async def format_response(state: CryptoAgentState) -> CryptoAgentOutput:
         return {
             "result": f"Could not fetch data for {state.coin_id} after {state.retry_count} attempts, please try different coin",
             "data": {}
-        }
\ No newline at end of file
+        }
+
+def render_comparison_template(query_type: str, days: Optional[int], contexts: List[dict], missing: List[str]) -> str:
+    missing_text = f" No data was found for {', '.join(missing)}." if missing else ""
+    if query_type == "price":
+        coins = []
+        for context in contexts:
+            change = context["change_24h"]
+            coins.append(
+                f"{coin_label(context['coin'])} {format_usd(context['price'])}"
+                + (f" ({'up' if change >= 0 else 'down'} {abs(change):.2f}% in 24h)" if change else "")
+            )
+        return PRICE_COMPARISON_TEMPLATE.format(coins="; ".join(coins), missing=missing_text)
+    
+    coins = []
+    for context in contexts:
+        start, end = context["price_range"]["start"], context["price_range"]["end"]
+        change = (end - start) / start * 100 if start else 0.0
+        coins.append(
+            f"{coin_label(context['coin'])} went from {format_usd(start)} to {format_usd(end)} "
+            f"({'up' if change >= 0 else 'down'} {abs(change):.2f}%)"
+        )
+    days = days or 1
+    return HISTORICAL_COMPARISON_TEMPLATE.format(
+        days=days,
+        day_word="day" if days == 1 else "days",
+        coins="; ".join(coins),
+        missing=missing_text
+    )
+
+async def format_comparison(state: CryptoAgentState, config: RunnableConfig) -> CryptoAgentOutput:
+    """Combine the per-coin results of a multi-coin query into one response"""
+    logger.info(f"Formatting comparison of {len(state.coin_results)} coins")
+    
+    # Parallel runs finish in any order; answer in the order the query named the coins
+    order = {coin_id: position for position, coin_id in enumerate(state.coin_ids)}
+    results = sorted(state.coin_results, key=lambda result: order.get(result["requested"], len(order)))
+    found = [result for result in results if result["data"]]
+    missing = [result["requested"] for result in results if not result["data"]]
+    
+    if not found:
+        error_msg = f"Could not fetch data for {', '.join(state.coin_ids)}"
+        logger.error(error_msg)
+        return {
+            "result": f"{error_msg}, please try different coins",
+            "data": {}
+        }
+    
+    if state.query_type == "price":
+        data = {}
+        contexts = []
+        for result in found:
+            data.update(result["data"])
+            price_data = result["data"][result["coin_id"]]
+            contexts.append({
+                "coin": result["coin_id"],
+                "price": price_data["usd"],
+                "change_24h": price_data.get("usd_24h_change", 0),
+                "market_cap": price_data.get("usd_market_cap", 0)
+            })
+    else:
+        data = {result["coin_id"]: result["data"] for result in found}
+        contexts = [
+            {
+                "coin": result["coin_id"],
+                "data_points": result["analytics"]["data_points"] if result.get("analytics") else len(result["data"]["prices"]),
+                "price_range": {
+                    "start": result["data"]["prices"][0][1],
+                    "end": result["data"]["prices"][-1][1]
+                },
+                "analytics": result.get("analytics")
+            }
+            for result in found
+        ]
+    
+    # The answer is only as fresh as its stalest coin
+    fresh_for = min(result["fresh_for"] for result in found)
+    if use_template(state):
+        return {
+            "result": render_comparison_template(state.query_type, state.days, contexts, missing),
+            "data": data,
+            "fresh_for": fresh_for
+        }
+    context = {"query": state.query, "days": state.days, "coins": contexts, "not_found": missing}
+    result = await write_response(
+        f"Format a response comparing these cryptocurrencies for the query: {state.query}\n"
+        f"{'Price' if state.query_type == 'price' else 'Historical'} data: {json.dumps(context)}",
+        config
+    )
+    return {
+        "result": result,
+        "data": data,
+        "fresh_for": fresh_for
+    }
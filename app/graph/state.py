@@ -1,5 +1,6 @@
+import operator
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, TypedDict, Literal
+from typing import Annotated, List, Optional, Dict, TypedDict, Literal
 from pydantic import BaseModel, Field
 
 class ResponseFormat(BaseModel):
@@ -11,6 +12,10 @@ class QueryAnalysis(BaseModel):
     coin_id: str = Field(description="The CoinGecko ID of the cryptocurrency (lowercase)")
     query_type: Literal["price", "historical"] = Field(description="Type of query (price or historical)")
     days: Optional[int] = Field(description="Number of days for historical data", default=None)
+    coin_ids: List[str] = Field(
+        description="CoinGecko IDs of every cryptocurrency when the query names several, e.g. a comparison",
+        default_factory=list
+    )
 
 class CryptoReflection(BaseModel):
     """Reflection on failed coin ID attempts"""
@@ -18,6 +23,11 @@ class CryptoReflection(BaseModel):
     sufficient: bool = Field(description="Whether we should stop trying to refine the coin ID")
     reasoning: str = Field(description="Reasoning behind the refinement or decision to stop")
 
+class CoinCandidates(BaseModel):
+    """Ranked coin IDs to verify after a failed fetch"""
+    candidates: List[str] = Field(description="CoinGecko IDs most likely meant by the query, best first")
+    reasoning: str = Field(description="Reasoning behind the ranking")
+
 @dataclass(kw_only=True)
 class CryptoAgentState:
     """State for the crypto agent workflow"""
@@ -25,13 +35,34 @@ class CryptoAgentState:
     coin_id: str = field(default="")
     query_type: Literal["price", "historical"] = field(default="price")
     days: Optional[int] = field(default=None)
+    max_points: Optional[int] = field(default=None)
+    # Spot prices a batch fetched up front, keyed by coin id
+    prices: Dict = field(default_factory=dict)
     current_price: Optional[Dict] = field(default=None)
     historical_price: Optional[Dict] = field(default=None)
+    analytics: Optional[Dict] = field(default=None)
+    # Seconds the fetched data stays fresh on the service, bounding how long the answer is cached
+    fresh_for: Optional[float] = field(default=None)
+    coin_ids: List[str] = field(default_factory=list)
+    # Per-coin results of a multi-coin query, appended by parallel fetch_coin runs
+    coin_results: Annotated[List[Dict], operator.add] = field(default_factory=list)
     coin_attempts: List[str] = field(default_factory=list)
     retry_count: int = field(default=0)
+    fast_path: bool = field(default=False)
+
+class CoinFetchState(TypedDict):
+    """Input of one fetch_coin run in a multi-coin query"""
+    query: str
+    coin_id: str
+    query_type: Literal["price", "historical"]
+    days: Optional[int]
+    max_points: Optional[int]
+    prices: Dict
 
 class CryptoAgentInput(TypedDict):
     query: str
+    max_points: Optional[int]
+    prices: Dict
 
 class CryptoAgentOutput(TypedDict):
     result: str
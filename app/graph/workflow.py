@@ -1,39 +1,126 @@
-from typing import Literal
+import os
+from typing import List, Literal, Union
 from langgraph.graph import StateGraph, END
+from langgraph.types import Send
 from app.graph.state import CryptoAgentState, CryptoAgentInput, CryptoAgentOutput
-from app.graph.nodes import analyze_query, fetch_data, reflect_on_coin, format_response
+from app.graph.nodes import (
+    MAX_FETCH_ATTEMPTS,
+    parse_query,
+    analyze_query,
+    fetch_data,
+    fetch_coin,
+    compute_analytics,
+    reflect_on_coin,
+    format_response,
+    format_comparison
+)
 from app.core.config import logger
+from app.core.metrics import instrument_node
 
-def should_retry(state: CryptoAgentState) -> Literal["reflect", "format_response"]:
+# Try the rule-based parser before the LLM analyzer
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+
+def fan_out_coins(state: CryptoAgentState) -> List[Send]:
+    """One parallel fetch_coin run per coin of a multi-coin query"""
+    return [
+        Send("fetch_coin", {
+            "query": state.query,
+            "coin_id": coin_id,
+            "query_type": state.query_type,
+            "days": state.days,
+            "max_points": state.max_points,
+            "prices": state.prices
+        })
+        for coin_id in state.coin_ids
+    ]
+
+def route_query(state: CryptoAgentState) -> Union[Literal["fetch_data", "analyze_query"], List[Send]]:
+    """Skip the LLM analyzer when the fast path resolved the query"""
+    if len(state.coin_ids) > 1:
+        return fan_out_coins(state)
+    if state.coin_id:
+        return "fetch_data"
+    return "analyze_query"
+
+def route_analysis(state: CryptoAgentState) -> Union[Literal["fetch_data"], List[Send]]:
+    """Fan out over the coins when the analyzer found several"""
+    if len(state.coin_ids) > 1:
+        return fan_out_coins(state)
+    return "fetch_data"
+
+def should_retry(state: CryptoAgentState) -> Literal["reflect", "analytics", "format_response"]:
     """Determine if we should try another coin ID format"""
-    if state.retry_count < 3 and not (state.current_price or state.historical_price):
+    if state.retry_count < MAX_FETCH_ATTEMPTS and not (state.current_price or state.historical_price):
         return "reflect"
+    if state.historical_price:
+        return "analytics"
     return "format_response"
 
+def after_reflection(state: CryptoAgentState) -> Literal["fetch_data", "format_response"]:
+    """Fetch the corrected coin unless reflection gave up or already verified its price"""
+    if state.retry_count >= MAX_FETCH_ATTEMPTS or state.current_price:
+        return "format_response"
+    return "fetch_data"
+
 def create_workflow() -> StateGraph:
     """Create and configure the workflow graph"""
     # Create the graph
     workflow = StateGraph(CryptoAgentState, input=CryptoAgentInput, output=CryptoAgentOutput)
 
-    # Add nodes
-    workflow.add_node("analyze_query", analyze_query)
-    workflow.add_node("fetch_data", fetch_data)
-    workflow.add_node("reflect", reflect_on_coin)
-    workflow.add_node("format_response", format_response)
+    # Add nodes, each timed for /metrics
+    workflow.add_node("analyze_query", instrument_node("analyze_query", analyze_query))
+    workflow.add_node("fetch_data", instrument_node("fetch_data", fetch_data))
+    workflow.add_node("analytics", instrument_node("analytics", compute_analytics))
+    workflow.add_node("reflect", instrument_node("reflect", reflect_on_coin))
+    workflow.add_node("format_response", instrument_node("format_response", format_response))
+    workflow.add_node("fetch_coin", instrument_node("fetch_coin", fetch_coin))
+    workflow.add_node("format_comparison", instrument_node("format_comparison", format_comparison))
 
     # Connect nodes
-    workflow.set_entry_point("analyze_query")
-    workflow.add_edge("analyze_query", "fetch_data")
+    if FAST_PATH_ENABLED:
+        workflow.add_node("parse_query", instrument_node("parse_query", parse_query))
+        workflow.set_entry_point("parse_query")
+        workflow.add_conditional_edges(
+            "parse_query",
+            route_query,
+            {
+                "fetch_data": "fetch_data",
+                "analyze_query": "analyze_query",
+                "fetch_coin": "fetch_coin"
+            }
+        )
+    else:
+        workflow.set_entry_point("analyze_query")
+    workflow.add_conditional_edges(
+        "analyze_query",
+        route_analysis,
+        {
+            "fetch_data": "fetch_data",
+            "fetch_coin": "fetch_coin"
+        }
+    )
     workflow.add_conditional_edges(
         "fetch_data",
         should_retry,
         {
             "reflect": "reflect",
+            "analytics": "analytics",
+            "format_response": "format_response"
+        }
+    )
+    workflow.add_edge("analytics", "format_response")
+    workflow.add_conditional_edges(
+        "reflect",
+        after_reflection,
+        {
+            "fetch_data": "fetch_data",
             "format_response": "format_response"
         }
     )
-    workflow.add_edge("reflect", "fetch_data")
     workflow.add_edge("format_response", END)
+    # Multi-coin queries: every fetch_coin run joins at a single formatting step
+    workflow.add_edge("fetch_coin", "format_comparison")
+    workflow.add_edge("format_comparison", END)
 
     # Compile the graph
     graph = workflow.compile()
@@ -20,6 +20,23 @@ Example successful refinements:
 - "BNB" -> "binancecoin"
 """
 
+COIN_CANDIDATES_PROMPT = """
+A cryptocurrency data fetch failed because the coin ID was not recognised. List the CoinGecko IDs the user most likely meant.
+
+Original Query: {query}
+Failed Coin ID: {coin_id}
+Previous Attempts: {previous_attempts}
+
+Respond with:
+- candidates: Up to {limit} CoinGecko IDs (lowercase), most likely first, excluding the previous attempts. Empty if the query names no real cryptocurrency
+- reasoning: Explanation of your ranking
+
+Example candidates:
+- "DOGE" -> ["dogecoin"]
+- "BNB" -> ["binancecoin"]
+- "etherium" -> ["ethereum", "ethereum-classic"]
+"""
+
 QUERY_ANALYSIS_PROMPT = """
 You are a cryptocurrency query analyzer. Your task is to extract information from the user's query.
 Given the query: "{query}"
@@ -28,6 +45,7 @@ Respond with a JSON object containing:
 1. coin_id: The CoinGecko ID of the cryptocurrency (lowercase, e.g., 'bitcoin', 'ethereum', 'dogecoin')
 2. query_type: Either 'price' for current price queries or 'historical' for historical data
 3. days: Number of days for historical data (null for current price queries)
+4. coin_ids: CoinGecko IDs of all cryptocurrencies when the query names several of them, e.g. a comparison (empty list otherwise)
 
 Your response should be a valid JSON object only, no other text.
 
@@ -37,9 +55,25 @@ For example, if someone asks "What's Bitcoin's current price?", respond with:
 Or if they ask "Show me Ethereum's 7-day history", respond with:
 {{"coin_id": "ethereum", "query_type": "historical", "days": 7}}
 
+Or if they ask "Compare Bitcoin and Solana over the last month", respond with:
+{{"coin_id": "bitcoin", "query_type": "historical", "days": 30, "coin_ids": ["bitcoin", "solana"]}}
+
 Remember to:
 - Always use lowercase for coin_id
 - Only use 'price' or 'historical' for query_type
 - Set days to null for current price queries
-- Include all three fields in your response
-""" 
\ No newline at end of file
+- Always include coin_id, query_type and days; when coin_ids is set, coin_id is its first entry
+"""
+
+# Deterministic responses used instead of the LLM formatter for plain lookups
+PRICE_RESPONSE_TEMPLATE = "The current price of {coin} is {price}{change}{market_cap}."
+
+HISTORICAL_RESPONSE_TEMPLATE = (
+    "Over the last {days} {day_word}, {coin} went from {start} to {end} "
+    "({change}){price_range}, based on {data_points} data points."
+)
+
+# Deterministic responses for multi-coin queries; {coins} is one clause per coin
+PRICE_COMPARISON_TEMPLATE = "Current prices: {coins}.{missing}"
+
+HISTORICAL_COMPARISON_TEMPLATE = "Over the last {days} {day_word}: {coins}.{missing}"
@@ -0,0 +1,88 @@
+import math
+from datetime import datetime, timezone
+from typing import Optional
+import numpy as np
+
+DAY_MS = 86_400_000
+
+# Look-back points reported when they fall inside the fetched range
+OFFSET_DAYS = (1, 7, 30, 90, 365)
+MOVING_AVERAGE_DAYS = (7, 30, 90)
+
+def _number(value: float) -> Optional[float]:
+    """Six significant digits keep the LLM context short without losing precision that matters.
+
+    NaN and infinities (a return from a zero price, say) are not valid JSON, so they become None.
+    """
+    value = float(value)
+    return float(f"{value:.6g}") if math.isfinite(value) else None
+
+def _time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+
+def summarize_history(data: dict) -> Optional[dict]:
+    """Summary statistics of a ``market_chart`` price series, computed in one pass over NumPy arrays.
+
+    Covers the low and high with their times, the total, best and worst
+    period returns, maximum drawdown, volatility, moving averages and the
+    price at fixed look-back offsets. Returns None for fewer than two prices.
+    """
+    points = [point for point in data.get("prices") or [] if point[1] is not None]
+    if len(points) < 2:
+        return None
+    series = np.asarray(points, dtype=np.float64)
+    timestamps, prices = series[:, 0], series[:, 1]
+
+    span_days = (timestamps[-1] - timestamps[0]) / DAY_MS
+    periods_per_day = DAY_MS / np.median(np.diff(timestamps))
+    low, high = prices.argmin(), prices.argmax()
+
+    returns = prices[1:] / prices[:-1] - 1
+    best, worst = returns.argmax(), returns.argmin()
+    log_returns = np.log(prices[1:] / prices[:-1])
+    daily_volatility = log_returns.std(ddof=1) * math.sqrt(periods_per_day) if len(log_returns) > 1 else 0.0
+    drawdowns = prices / np.maximum.accumulate(prices) - 1
+
+    summary = {
+        "start": {"price": _number(prices[0]), "time": _time(timestamps[0])},
+        "end": {"price": _number(prices[-1]), "time": _time(timestamps[-1])},
+        "low": {"price": _number(prices[low]), "time": _time(timestamps[low])},
+        "high": {"price": _number(prices[high]), "time": _time(timestamps[high])},
+        "change_pct": _number((prices[-1] / prices[0] - 1) * 100),
+        "best_period_return_pct": _number(returns[best] * 100),
+        "best_period_end": _time(timestamps[best + 1]),
+        "worst_period_return_pct": _number(returns[worst] * 100),
+        "worst_period_end": _time(timestamps[worst + 1]),
+        "max_drawdown_pct": _number(drawdowns.min() * 100),
+        "daily_volatility_pct": _number(daily_volatility * 100),
+        "annualized_volatility_pct": _number(daily_volatility * math.sqrt(365) * 100),
+        "data_points": len(prices),
+    }
+
+    # Trailing simple moving averages from one cumulative sum
+    cumulative = np.concatenate(([0.0], np.cumsum(prices)))
+    moving_averages = {}
+    for days in MOVING_AVERAGE_DAYS:
+        window = int(round(days * periods_per_day))
+        if days < span_days and 1 < window < len(prices):
+            moving_averages[f"{days}d"] = _number((cumulative[-1] - cumulative[-window - 1]) / window)
+    if moving_averages:
+        summary["moving_averages"] = moving_averages
+
+    # Price at each look-back offset, taken from the first point at or after it
+    targets = np.array([timestamps[-1] - days * DAY_MS for days in OFFSET_DAYS])
+    positions = np.searchsorted(timestamps, targets)
+    ago = {}
+    step = DAY_MS / periods_per_day
+    for days, target, position in zip(OFFSET_DAYS, targets, positions):
+        # Allow one point of slack so a 7-day series still reports "7d"
+        if target >= timestamps[0] - step and position < len(prices) - 1:
+            ago[f"{days}d"] = {
+                "price": _number(prices[position]),
+                "time": _time(timestamps[position]),
+                "change_since_pct": _number((prices[-1] / prices[position] - 1) * 100),
+            }
+    if ago:
+        summary["ago"] = ago
+
+    return summary
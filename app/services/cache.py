@@ -0,0 +1,94 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+def parse_ttl_tiers(spec: str) -> List[Tuple[Optional[int], int]]:
+    """Parse "1:60,7:300,*:14400" into [(1, 60), (7, 300), (None, 14400)]."""
+    tiers = []
+    for item in spec.split(","):
+        max_days, ttl = item.strip().split(":")
+        tiers.append((None if max_days == "*" else int(max_days), int(ttl)))
+    return sorted(tiers, key=lambda tier: float("inf") if tier[0] is None else tier[0])
+
+# Same policy and variables as the CoinGecko service, so backend caches never
+# outlive the freshness of the data behind them
+PRICE_CACHE_TTL = int(os.getenv("PRICE_CACHE_TTL", 30))
+HISTORICAL_CACHE_TTL_TIERS = parse_ttl_tiers(
+    os.getenv("HISTORICAL_CACHE_TTL_TIERS", "1:60,7:300,30:900,90:1800,*:14400")
+)
+
+def data_ttl(query_type: str, days: Optional[int] = None) -> int:
+    """Freshness window in seconds for price or historical data."""
+    if query_type == "price":
+        return PRICE_CACHE_TTL
+    for max_days, ttl in HISTORICAL_CACHE_TTL_TIERS:
+        if max_days is None or (days or 1) <= max_days:
+            return ttl
+    return HISTORICAL_CACHE_TTL_TIERS[-1][1]
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after their own TTL.
+
+    Not thread-safe; meant for use from the event loop only.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        return self._entries.pop(key, None) is not None
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Drop every key starting with ``prefix``; linear in the cache size."""
+        keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -1,39 +1,325 @@
+import asyncio
 import json
 import os
+import re
+import time
+from typing import List, Optional
 import httpx
+import redis.asyncio as redis
 from app.core.config import logger
+from app.core.metrics import SERVICE_REQUEST_DURATION
+from app.services.cache import TTLCache, data_ttl
+from app.services.downsample import downsample_chart
+from app.services.replicas import ReplicaPool
 
 # Use service name for Docker's internal DNS resolution
 COINGECKO_SERVICE_URL = os.getenv("COINGECKO_SERVICE_URL", "http://coingecko:8001")
 
+# Client-side load balancing: explicit replica URLs, or every address the service name resolves to
+COINGECKO_SERVICE_URLS = [
+    url.strip() for url in os.getenv("COINGECKO_SERVICE_URLS", COINGECKO_SERVICE_URL).split(",") if url.strip()
+]
+COINGECKO_REPLICA_POOL = os.getenv("COINGECKO_REPLICA_POOL", "true").lower() == "true"
+COINGECKO_REPLICA_DISCOVERY = os.getenv("COINGECKO_REPLICA_DISCOVERY", "dns").lower()
+COINGECKO_HEALTH_INTERVAL = float(os.getenv("COINGECKO_HEALTH_INTERVAL", 5))
+COINGECKO_HEALTH_TIMEOUT = float(os.getenv("COINGECKO_HEALTH_TIMEOUT", 2))
+# Consecutive failures (errors or 5xx) that open a replica's circuit, and for how long
+COINGECKO_BREAKER_FAILURES = int(os.getenv("COINGECKO_BREAKER_FAILURES", 5))
+COINGECKO_BREAKER_OPEN_SECONDS = float(os.getenv("COINGECKO_BREAKER_OPEN_SECONDS", 10))
+# Send a second copy of a request still unanswered after the recent p95 latency
+COINGECKO_HEDGE_ENABLED = os.getenv("COINGECKO_HEDGE_ENABLED", "true").lower() == "true"
+COINGECKO_HEDGE_MIN_DELAY_MS = float(os.getenv("COINGECKO_HEDGE_MIN_DELAY_MS", 50))
+
+# Connection pool limits for the shared client
+COINGECKO_MAX_CONNECTIONS = int(os.getenv("COINGECKO_MAX_CONNECTIONS", 100))
+COINGECKO_MAX_KEEPALIVE = int(os.getenv("COINGECKO_MAX_KEEPALIVE", 20))
+COINGECKO_KEEPALIVE_EXPIRY = float(os.getenv("COINGECKO_KEEPALIVE_EXPIRY", 30))
+
+# Per-phase timeouts in seconds
+COINGECKO_CONNECT_TIMEOUT = float(os.getenv("COINGECKO_CONNECT_TIMEOUT", 2))
+COINGECKO_READ_TIMEOUT = float(os.getenv("COINGECKO_READ_TIMEOUT", 10))
+COINGECKO_WRITE_TIMEOUT = float(os.getenv("COINGECKO_WRITE_TIMEOUT", 5))
+COINGECKO_POOL_TIMEOUT = float(os.getenv("COINGECKO_POOL_TIMEOUT", 5))
+
+# HTTP/2 needs the optional h2 package and only applies to https endpoints
+COINGECKO_HTTP2 = os.getenv("COINGECKO_HTTP2", "true").lower() == "true"
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# In-process L1 cache of service responses, keyed like the service's Redis keys
+COINGECKO_L1_ENABLED = os.getenv("COINGECKO_L1_ENABLED", "true").lower() == "true"
+COINGECKO_L1_MAX_ENTRIES = int(os.getenv("COINGECKO_L1_MAX_ENTRIES", 1000))
+
+# Drop L1 entries as soon as the service rewrites them in Redis
+COINGECKO_L1_INVALIDATION = os.getenv("COINGECKO_L1_INVALIDATION", "true").lower() == "true"
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+INVALIDATION_RETRY_SECONDS = 5
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+_client: Optional[httpx.AsyncClient] = None
+_pool: Optional[ReplicaPool] = None
+_pool_task: Optional[asyncio.Task] = None
+
+_l1 = TTLCache(COINGECKO_L1_MAX_ENTRIES)
+_l1_invalidations = 0
+
+# When each key's data goes stale on the service, kept even with the L1 cache off,
+# so answers built from the data are not cached for longer than the data is fresh
+_fresh_until = TTLCache(COINGECKO_L1_MAX_ENTRIES)
+
+class ServiceUnavailable(Exception):
+    """The CoinGecko service failed to answer, so whether the coin exists is unknown.
+
+    Raised for anything but a 404, which alone means the coin id is wrong;
+    ``retry_after`` is the service's ``Retry-After`` in seconds, if it sent one.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _raise_unless_not_found(error: Exception) -> None:
+    if isinstance(error, httpx.HTTPStatusError):
+        if error.response.status_code == 404:
+            return
+        retry_after = error.response.headers.get("Retry-After", "")
+        raise ServiceUnavailable(str(error), int(retry_after) if retry_after.isdigit() else None) from error
+    raise ServiceUnavailable(str(error)) from error
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = COINGECKO_HTTP2 and HTTP2_AVAILABLE
+    logger.info(
+        f"Creating CoinGecko service client: max_connections={COINGECKO_MAX_CONNECTIONS}, "
+        f"max_keepalive={COINGECKO_MAX_KEEPALIVE}, http2={http2}"
+    )
+    return httpx.AsyncClient(
+        base_url=COINGECKO_SERVICE_URL,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=COINGECKO_MAX_CONNECTIONS,
+            max_keepalive_connections=COINGECKO_MAX_KEEPALIVE,
+            keepalive_expiry=COINGECKO_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=COINGECKO_CONNECT_TIMEOUT,
+            read=COINGECKO_READ_TIMEOUT,
+            write=COINGECKO_WRITE_TIMEOUT,
+            pool=COINGECKO_POOL_TIMEOUT,
+        ),
+    )
+
+async def start_client() -> None:
+    """Open the shared client and the replica pool; called from the FastAPI lifespan."""
+    global _client, _pool, _pool_task
+    if _client is None:
+        _client = _build_client()
+    if COINGECKO_REPLICA_POOL and _pool is None:
+        _pool = ReplicaPool(
+            get_client,
+            COINGECKO_SERVICE_URLS,
+            COINGECKO_REPLICA_DISCOVERY == "dns",
+            COINGECKO_HEALTH_INTERVAL,
+            COINGECKO_HEALTH_TIMEOUT,
+            COINGECKO_BREAKER_FAILURES,
+            COINGECKO_BREAKER_OPEN_SECONDS,
+            COINGECKO_HEDGE_ENABLED,
+            COINGECKO_HEDGE_MIN_DELAY_MS / 1000
+        )
+        await _pool.discover()
+        logger.info(f"CoinGecko service replicas: {', '.join(_pool.replicas)}")
+        _pool_task = asyncio.create_task(_pool.run())
+
+async def close_client() -> None:
+    """Close the shared client and its pooled connections."""
+    global _client, _pool, _pool_task
+    if _pool_task is not None:
+        _pool_task.cancel()
+        _pool, _pool_task = None, None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("CoinGecko service client closed")
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily outside the app lifespan."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+async def service_get(path: str, params: Optional[dict] = None) -> httpx.Response:
+    """GET from the service through the replica pool, or via DNS when the pool is off."""
+    # "/price/bitcoin" -> "price", so coin ids do not become labels
+    endpoint = path.split("/")[1]
+    started = time.perf_counter()
+    status, cache = "error", "none"
+    try:
+        if _pool is not None:
+            response = await _pool.request("GET", path, params=params)
+        else:
+            response = await get_client().get(path, params=params)
+        status, cache = str(response.status_code), response.headers.get("X-Cache", "none").lower()
+        return response
+    finally:
+        SERVICE_REQUEST_DURATION.labels(endpoint, status, cache).observe(time.perf_counter() - started)
+
+def replica_pool_stats() -> Optional[dict]:
+    return _pool.stats() if _pool is not None else None
+
+def _l1_get(key: str) -> Optional[dict]:
+    return _l1.get(key) if COINGECKO_L1_ENABLED else None
+
+def _l1_set(key: str, value: dict, response: httpx.Response, fallback_ttl: int) -> None:
+    """Keep a response for the rest of its freshness window on the service.
+
+    The service reports what is left of it in ``Cache-Control: max-age``;
+    stale responses carry ``max-age=0`` and are not kept.
+    """
+    match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    max_age = int(match.group(1)) if match else fallback_ttl
+    _fresh_until.set(key, time.monotonic() + max_age, max_age)
+    if COINGECKO_L1_ENABLED:
+        _l1.set(key, value, max_age)
+
+def _freshness(key: str) -> float:
+    fresh_until = _fresh_until.get(key)
+    return max(0.0, fresh_until - time.monotonic()) if fresh_until is not None else 0.0
+
+def price_freshness(coin_id: str) -> float:
+    """Seconds the last fetched price of ``coin_id`` stays fresh; 0 when stale or unknown."""
+    return _freshness(f"price:{coin_id}")
+
+def historical_freshness(coin_id: str, days: int) -> float:
+    """Seconds the last fetched (full-resolution) history of ``coin_id`` stays fresh."""
+    return _freshness(f"historical:{coin_id}:{days}")
+
+def l1_cache_stats() -> dict:
+    return {**_l1.stats(), "enabled": COINGECKO_L1_ENABLED, "invalidations": _l1_invalidations}
+
+async def listen_for_invalidations() -> None:
+    """Background task: evict L1 entries the service has just refreshed.
+
+    The service publishes the Redis keys it writes on
+    ``CACHE_INVALIDATION_CHANNEL``; a trailing ``*`` stands for every key
+    with that prefix. Messages missed while disconnected cannot
+    be replayed, so the L1 cache is cleared whenever the subscription starts.
+    """
+    global _l1_invalidations
+    if not (COINGECKO_L1_ENABLED and COINGECKO_L1_INVALIDATION):
+        return
+    while True:
+        client = redis.from_url(REDIS_URL)
+        try:
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                _l1.clear()
+                logger.info(f"Listening for cache invalidations on {CACHE_INVALIDATION_CHANNEL}")
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    for key in message["data"].decode().split():
+                        if key.endswith("*"):
+                            _l1_invalidations += _l1.delete_prefix(key[:-1])
+                        elif _l1.delete(key):
+                            _l1_invalidations += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Cache invalidation listener disconnected: {str(e)}")
+        finally:
+            await client.aclose()
+        await asyncio.sleep(INVALIDATION_RETRY_SECONDS)
+
 async def get_crypto_price(coin_id: str) -> dict:
-    """Get current price for a cryptocurrency."""
+    """Get current price for a cryptocurrency; None if the service does not know the coin."""
+    cache_key = f"price:{coin_id}"
+    cached = _l1_get(cache_key)
+    if cached is not None:
+        logger.info(f"L1 cache HIT for price: {coin_id}")
+        return cached
+
     logger.info(f"Fetching price for coin: {coin_id}")
-    
+
     try:
-        async with httpx.AsyncClient() as client:
-            # Docker's internal DNS will handle load balancing
-            response = await client.get(f"{COINGECKO_SERVICE_URL}/price/{coin_id}", timeout=10.0)
-            response.raise_for_status()
-            return response.json()
+        response = await service_get(f"/price/{coin_id}")
+        response.raise_for_status()
+        data = response.json()
+        _l1_set(cache_key, data, response, data_ttl("price"))
+        return data
     except Exception as e:
         logger.error(f"Error fetching price for {coin_id}: {str(e)}")
+        _raise_unless_not_found(e)
         return None
 
-async def get_historical_price(coin_id: str, days: int) -> dict:
-    """Get historical price data."""
+async def get_crypto_prices(coin_ids: List[str]) -> dict:
+    """Get current prices for several cryptocurrencies in one request.
+
+    Returns a dict keyed by coin id; ids the service does not know are absent.
+    Only ids missing from the L1 cache are requested from the service.
+    """
+    result, missing = {}, []
+    for coin_id in coin_ids:
+        cached = _l1_get(f"price:{coin_id}")
+        if cached is not None:
+            result.update(cached)
+        else:
+            missing.append(coin_id)
+    if not missing:
+        logger.info(f"L1 cache HIT for prices: {', '.join(coin_ids)}")
+        return result
+
+    logger.info(f"Fetching prices for coins: {', '.join(missing)}")
+
+    try:
+        response = await service_get("/prices", params={"ids": ",".join(missing)})
+        response.raise_for_status()
+        data = response.json()
+        for coin_id, price in data.items():
+            _l1_set(f"price:{coin_id}", {coin_id: price}, response, data_ttl("price"))
+        result.update(data)
+        return result
+    except Exception as e:
+        logger.error(f"Error fetching prices for {', '.join(coin_ids)}: {str(e)}")
+        _raise_unless_not_found(e)
+        return None
+
+async def get_historical_price(coin_id: str, days: int, max_points: Optional[int] = None) -> dict:
+    """Get historical price data, downsampled to at most ``max_points`` points per series if given."""
+    cache_key = f"historical:{coin_id}:{days}" + (f":{max_points}" if max_points else "")
+    cached = _l1_get(cache_key)
+    if cached is not None:
+        logger.info(f"L1 cache HIT for historical data: {coin_id}, days: {days}")
+        return cached
+
     logger.info(f"Fetching historical data for coin: {coin_id}, days: {days}")
-    
+
+    params = {"days": days}
+    if max_points:
+        params["max_points"] = max_points
     try:
-        async with httpx.AsyncClient() as client:
-            # Docker's internal DNS will handle load balancing
-            response = await client.get(
-                f"{COINGECKO_SERVICE_URL}/historical/{coin_id}",
-                params={"days": days},
-                timeout=10.0
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await service_get(f"/historical/{coin_id}", params=params)
+        response.raise_for_status()
+        # Service replicas that predate max_points return every point
+        data = downsample_chart(response.json(), max_points)
+        _l1_set(cache_key, data, response, data_ttl("historical", days))
+        return data
     except Exception as e:
         logger.error(f"Error fetching historical data for {coin_id}: {str(e)}")
-        return None 
\ No newline at end of file
+        _raise_unless_not_found(e)
+        return None
+
+async def get_coin_list() -> list:
+    """Get id, symbol and name of every coin the service knows."""
+    logger.info("Fetching coin list")
+
+    try:
+        response = await service_get("/coins/list")
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        logger.error(f"Error fetching coin list: {str(e)}")
+        return None
@@ -0,0 +1,41 @@
+from typing import Optional
+import numpy as np
+
+# Smallest max_points accepted: first, last and one min/max bucket
+MIN_POINTS = 4
+
+def downsample_indices(values: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of at most ``max_points`` points that keep the shape of ``values``.
+
+    The first and last points are kept and the rest is split into equal
+    buckets, each contributing its minimum and maximum, so spikes and dips
+    survive. Same algorithm as the CoinGecko service.
+    """
+    count = len(values)
+    if count <= max_points:
+        return np.arange(count)
+    inner = values[1:-1]
+    buckets = (max_points - 2) // 2
+    size = -(-len(inner) // buckets)
+    rows = -(-len(inner) // size)
+    padding = rows * size - len(inner)
+    missing = np.isnan(inner)
+    lows = np.pad(np.where(missing, np.inf, inner), (0, padding), constant_values=np.inf).reshape(rows, size)
+    highs = np.pad(np.where(missing, -np.inf, inner), (0, padding), constant_values=-np.inf).reshape(rows, size)
+    offsets = np.arange(rows) * size + 1
+    return np.unique(np.concatenate((
+        [0], offsets + lows.argmin(axis=1), offsets + highs.argmax(axis=1), [count - 1]
+    )))
+
+def downsample_chart(data: dict, max_points: Optional[int]) -> dict:
+    """Downsample every ``[ts, value]`` series of a ``market_chart`` response."""
+    if not max_points:
+        return data
+    chart = {}
+    for field, points in data.items():
+        if not isinstance(points, list) or len(points) <= max_points:
+            chart[field] = points
+            continue
+        values = np.array([np.nan if value is None else value for _, value in points], dtype=np.float64)
+        chart[field] = [points[index] for index in downsample_indices(values, max_points).tolist()]
+    return chart
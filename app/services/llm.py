@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional, Type, TypeVar
+from pydantic import BaseModel
+from langchain_core.messages import BaseMessage
+from app.core.config import model, logger, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_RETRY_BACKOFF
+from app.core.metrics import LLM_DURATION, LLM_RETRIES, LLM_TOKENS
+
+T = TypeVar("T", bound=BaseModel)
+
+# Shared by every node so the cap applies to the whole process
+_llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Structured-output runnables are stateless, so build each one only once
+_structured_models: Dict[type, object] = {}
+
+def _structured_model(schema: Type[T]):
+    if schema not in _structured_models:
+        # The raw message carries the token usage
+        _structured_models[schema] = model.with_structured_output(schema, include_raw=True)
+    return _structured_models[schema]
+
+def _record_usage(call: str, usage: Optional[dict]) -> None:
+    if usage:
+        LLM_TOKENS.labels(call, "input").inc(usage.get("input_tokens", 0))
+        LLM_TOKENS.labels(call, "output").inc(usage.get("output_tokens", 0))
+
+async def _backoff(call: str, attempt: int, error: Exception) -> None:
+    LLM_RETRIES.labels(call).inc()
+    delay = LLM_RETRY_BACKOFF * 2 ** attempt
+    logger.warning(f"LLM call for {call} failed ({str(error)}), retrying in {delay:.1f}s")
+    await asyncio.sleep(delay)
+
+async def invoke_structured(schema: Type[T], messages: List[BaseMessage]) -> T:
+    """Run a structured-output LLM call without blocking the event loop.
+
+    Errors and answers that do not parse into ``schema`` are retried up to
+    ``LLM_MAX_RETRIES`` times with exponential backoff.
+    """
+    call = schema.__name__
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with _llm_semaphore:
+                logger.info(f"Invoking LLM for {call}")
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    result = await _structured_model(schema).ainvoke(messages)
+                    _record_usage(call, getattr(result["raw"], "usage_metadata", None))
+                    if result["parsed"] is None:
+                        outcome = "unparsable"
+                        raise ValueError(f"Unparsable {call} answer: {result['parsing_error']}")
+                    outcome = "ok"
+                    return result["parsed"]
+                finally:
+                    LLM_DURATION.labels(call, outcome).observe(time.perf_counter() - started)
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            await _backoff(call, attempt, e)
+
+async def stream_text(messages: List[BaseMessage]) -> AsyncIterator[str]:
+    """Stream a plain-text LLM response chunk by chunk, under the same concurrency cap.
+
+    Only a stream that fails before its first chunk is retried.
+    """
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        streamed = False
+        try:
+            async with _llm_semaphore:
+                logger.info("Streaming LLM response")
+                started = time.perf_counter()
+                outcome = "error"
+                # Each chunk reports the tokens it added
+                usage = {"input_tokens": 0, "output_tokens": 0}
+                try:
+                    async for chunk in model.astream(messages):
+                        for kind, count in (getattr(chunk, "usage_metadata", None) or {}).items():
+                            if kind in usage:
+                                usage[kind] += count
+                        content = chunk.content
+                        if not isinstance(content, str):
+                            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+                        if content:
+                            streamed = True
+                            yield content
+                    outcome = "ok"
+                finally:
+                    LLM_DURATION.labels("stream", outcome).observe(time.perf_counter() - started)
+                    _record_usage("stream", usage)
+            return
+        except Exception as e:
+            if streamed or attempt == LLM_MAX_RETRIES:
+                raise
+            await _backoff("stream", attempt, e)
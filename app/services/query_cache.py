@@ -0,0 +1,143 @@
+import json
+import os
+import re
+import unicodedata
+from typing import List, Optional
+import redis.asyncio as redis
+from app.core.config import logger
+from app.services.cache import TTLCache, data_ttl
+
+# Query-level cache in front of the workflow: L1 in process, L2 in Redis
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 10000))
+
+# Analyses do not go stale the way prices do
+QUERY_ANALYSIS_CACHE_TTL = int(os.getenv("QUERY_ANALYSIS_CACHE_TTL", 86400))
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+_l1 = TTLCache(QUERY_CACHE_MAX_ENTRIES)
+_redis = None
+
+async def start_query_cache() -> None:
+    """Connect the Redis tier; the L1 tier works without it."""
+    global _redis
+    if not QUERY_CACHE_ENABLED:
+        return
+    try:
+        _redis = redis.from_url(REDIS_URL)
+        await _redis.ping()
+        logger.info(f"Query cache using Redis at {REDIS_URL}")
+    except Exception:
+        logger.warning("Redis not available - query cache is in-process only")
+        _redis = None
+
+async def close_query_cache() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query, so trivially different phrasings share a key.
+
+    Works for every script: NFKC folds full-width and other compatibility
+    forms, ``casefold`` folds case, and only punctuation is dropped. Empty
+    for a query of punctuation alone, which must not be cached.
+    """
+    text = unicodedata.normalize("NFKC", query).casefold()
+    return " ".join(re.sub(r"[^\w\s\-]", "", text).split())
+
+def _key(kind: str, query: str) -> Optional[str]:
+    normalized = normalize_query(query)
+    return f"query:{kind}:{normalized}" if normalized else None
+
+async def _get(key: str) -> Optional[dict]:
+    value = _l1.get(key)
+    if value is not None:
+        return value
+    if _redis is None:
+        return None
+    try:
+        async with _redis.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.pttl(key)
+            raw, pttl = await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Query cache read failed for {key}: {str(e)}")
+        return None
+    if raw is None:
+        return None
+    value = json.loads(raw)
+    # Promote to L1 for the rest of the entry's lifetime
+    _l1.set(key, value, pttl / 1000 if pttl and pttl > 0 else 0)
+    return value
+
+async def _set(key: str, value: dict, ttl: int) -> None:
+    _l1.set(key, value, ttl)
+    if _redis is None:
+        return
+    try:
+        await _redis.setex(key, ttl, json.dumps(value))
+    except Exception as e:
+        logger.warning(f"Query cache write failed for {key}: {str(e)}")
+
+def _result_key(query: str, max_points: Optional[int]) -> Optional[str]:
+    key = _key("result", query)
+    return f"{key}:{max_points}" if key and max_points else key
+
+async def get_cached_result(query: str, max_points: Optional[int] = None) -> Optional[dict]:
+    """Final workflow output for an equivalent query, if still fresh."""
+    key = _result_key(query, max_points)
+    if not QUERY_CACHE_ENABLED or key is None:
+        return None
+    return await _get(key)
+
+async def cache_result(query: str, output: dict, max_points: Optional[int] = None) -> None:
+    """Cache a successful workflow output for as long as its data is fresh.
+
+    ``fresh_for`` is what was left of the data's freshness on the service
+    when it was fetched; data already near the end of its window does not
+    earn the answer a full ``data_ttl``.
+    """
+    key = _result_key(query, max_points)
+    if not QUERY_CACHE_ENABLED or key is None or not output.get("data"):
+        return
+    ttl = data_ttl(output.get("query_type", "price"), output.get("days"))
+    if output.get("fresh_for") is not None:
+        ttl = min(ttl, int(output["fresh_for"]))
+    # Redis needs whole seconds
+    if ttl < 1:
+        return
+    await _set(
+        key,
+        {"result": output["result"], "data": output["data"]},
+        ttl
+    )
+
+async def get_cached_analysis(query: str) -> Optional[dict]:
+    """Resolved ``coin_id``/``coin_ids``/``query_type``/``days`` from an earlier run of this query."""
+    key = _key("analysis", query)
+    if not QUERY_CACHE_ENABLED or key is None:
+        return None
+    return await _get(key)
+
+async def cache_analysis(
+    query: str,
+    coin_id: str,
+    query_type: str,
+    days: Optional[int],
+    coin_ids: Optional[List[str]] = None
+) -> None:
+    """Remember how a query was resolved so the next run can skip the LLM analyzer."""
+    key = _key("analysis", query)
+    if not QUERY_CACHE_ENABLED or key is None:
+        return
+    await _set(
+        key,
+        {"coin_id": coin_id, "coin_ids": coin_ids or [], "query_type": query_type, "days": days},
+        QUERY_ANALYSIS_CACHE_TTL
+    )
+
+def query_cache_stats() -> dict:
+    return {"l1": _l1.stats(), "redis": _redis is not None}
@@ -0,0 +1,114 @@
+import re
+from typing import List, Optional
+from app.graph.state import QueryAnalysis
+from app.services.resolver import resolver
+
+# Words that carry no information beyond "this is a price question"
+FILLER_WORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "to", "at", "is", "are", "was", "be",
+    "what", "whats", "how", "has", "have", "does", "do", "did", "one", "tell", "me", "show",
+    "give", "get", "i", "want", "know", "please", "can", "you", "could", "would",
+    "current", "currently", "right", "now", "today", "latest", "live", "spot", "real", "time",
+    "usd", "dollars", "dollar", "coin", "token", "crypto", "cryptocurrency",
+}
+# Separate the coins of a list ("BTC, ETH and SOL price")
+LIST_SEPARATORS = {",", "and"}
+PRICE_WORDS = {
+    "price", "prices", "much", "worth", "cost", "costs", "value", "valued", "trading", "quote",
+    "rate", "market", "cap", "mcap", "marketcap", "capitalization",
+}
+# Words that only join the coins of a comparison ("BTC vs ETH", "compare BTC with ETH")
+COMPARE_WORDS = {"compare", "comparison", "compared", "vs", "vs.", "versus", "against", "between", "with", "or", "&"}
+HISTORY_WORDS = {
+    "history", "historical", "chart", "trend", "performance", "performed", "change",
+    "changed", "over", "ago", "past", "last", "previous", "during", "data",
+}
+
+# Most coins a single comparison query may name
+MAX_COMPARE_COINS = 10
+# Longest coin name matched as one phrase ("bitcoin cash", "internet computer")
+MAX_COIN_WORDS = 3
+
+UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365, "hour": 1 / 24}
+SHORT_UNITS = {"d": "day", "w": "week", "y": "year", "h": "hour"}
+
+# "7 days", "7-day", "2 weeks", "last 24 hours", "7d"
+NUMBERED_WINDOW = re.compile(r"\b(\d{1,4})\s*-?\s*(day|week|month|year|hour|d|w|y|h)s?\b")
+# "last week", "past month", "this year", "yesterday"
+NAMED_WINDOW = re.compile(r"\b(?:last|past|previous|this)\s+(day|week|month|year)\b|\b(yesterday)\b")
+
+def _extract_days(text: str):
+    """Return (days, text without the window phrase), or (None, text)."""
+    match = NUMBERED_WINDOW.search(text)
+    if match:
+        unit = SHORT_UNITS.get(match.group(2), match.group(2))
+        days = max(1, round(int(match.group(1)) * UNIT_DAYS[unit]))
+        return days, text[:match.start()] + " " + text[match.end():]
+    match = NAMED_WINDOW.search(text)
+    if match:
+        unit = match.group(1) or "day"
+        return UNIT_DAYS[unit], text[:match.start()] + " " + text[match.end():]
+    return None, text
+
+def _list_coins(groups: List[List[str]]) -> Optional[List[str]]:
+    """One coin per group of words between separators; None if any group is not exactly one coin."""
+    coin_ids = []
+    for group in groups:
+        coin_id = resolver.exact(" ".join(group)) if len(group) <= MAX_COIN_WORDS else None
+        if not coin_id:
+            return None
+        if coin_id not in coin_ids:
+            coin_ids.append(coin_id)
+    return coin_ids
+
+def parse_query(query: str) -> Optional[QueryAnalysis]:
+    """Parse simple price/history questions without the LLM.
+
+    Handles shapes like "price of BTC", "what's DOGE worth", "ETH last 30 days",
+    "bitcoin 7-day chart" or "compare BTC, ETH and SOL". Returns None unless
+    every word is accounted for and each coin resolves to exactly one
+    CoinGecko id, so anything unusual is left to the LLM analyzer.
+    """
+    text = query.lower().replace("’", "'")
+    text = re.sub(r"'s\b", "", text)
+    days, text = _extract_days(text)
+
+    words = re.findall(r"[a-z0-9&][a-z0-9.\-]*|,", text)
+    coin_words = []
+    # Coin words between separators; several coins count only when each has its own group
+    groups = [[]]
+    saw_price = saw_history = saw_compare = False
+    for word in words:
+        if word in LIST_SEPARATORS:
+            groups.append([])
+        elif word in PRICE_WORDS:
+            saw_price = True
+        elif word in HISTORY_WORDS:
+            saw_history = True
+        elif word in COMPARE_WORDS:
+            saw_compare = True
+            groups.append([])
+        elif word not in FILLER_WORDS:
+            coin_words.append(word)
+            groups[-1].append(word)
+
+    if not coin_words:
+        return None
+    # One coin mention, possibly multi-word ("bitcoin cash", "shiba inu")
+    coin_id = resolver.exact(" ".join(coin_words)) if len(coin_words) <= MAX_COIN_WORDS else None
+    # Adjacent words ("bitcoin gold") are a name the resolver does not know, not two coins
+    coin_ids = [coin_id] if coin_id else _list_coins([group for group in groups if group])
+    if not coin_ids or len(coin_ids) > MAX_COMPARE_COINS:
+        return None
+    if saw_compare and len(coin_ids) < 2:
+        return None
+    analysis = {"coin_id": coin_ids[0], "coin_ids": coin_ids if len(coin_ids) > 1 else []}
+
+    if days is not None:
+        return QueryAnalysis(**analysis, query_type="historical", days=days)
+    if saw_history:
+        # A history question without a range; let the LLM pick one
+        return None
+    if saw_price or saw_compare or len([word for word in words if word not in LIST_SEPARATORS]) == len(coin_words):
+        return QueryAnalysis(**analysis, query_type="price", days=None)
+    return None
@@ -0,0 +1,188 @@
+import os
+import re
+import time
+from functools import wraps
+from typing import Dict, NamedTuple, Optional, Tuple
+import redis.asyncio as redis
+from fastapi import HTTPException, Request
+from app.core.config import logger
+
+# Limits shared by every worker and container through Redis
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Redis calls slower than this fall back to the local limiter
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", 0.1))
+# After a Redis error the local limiter is used for this long before Redis is tried again
+RATE_LIMIT_REDIS_RETRY_SECONDS = float(os.getenv("RATE_LIMIT_REDIS_RETRY_SECONDS", 5))
+
+# Callers sending a configured API key in this header get that key's limits instead of the per-IP ones
+RATE_LIMIT_API_KEY_HEADER = os.getenv("RATE_LIMIT_API_KEY_HEADER", "X-API-Key")
+
+UNIT_SECONDS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+class RateLimit(NamedTuple):
+    count: int
+    period: float
+
+    def __str__(self) -> str:
+        return f"{self.count} per {self.period:g} seconds"
+
+def parse_rate(spec: str) -> RateLimit:
+    """Parse "5/minute", "100 per hour" or "10/30 seconds"."""
+    match = re.fullmatch(r"\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*", spec.lower())
+    if not match:
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    count, multiple, unit = match.groups()
+    return RateLimit(int(count), int(multiple or 1) * UNIT_SECONDS[unit])
+
+def parse_limits(spec: str) -> Dict[str, RateLimit]:
+    """Parse "name=5/minute;other=100/hour" into ``{name: RateLimit}``."""
+    limits = {}
+    for item in spec.split(";"):
+        if item.strip():
+            name, rate = item.split("=", 1)
+            limits[name.strip()] = parse_rate(rate)
+    return limits
+
+# Overrides of the limits declared on routes, e.g. "/query=10/minute;/query/batch=2/minute"
+RATE_LIMIT_ROUTES = parse_limits(os.getenv("RATE_LIMIT_ROUTES", ""))
+# Limits per API key on every limited route, e.g. "partner-key=600/minute"
+RATE_LIMIT_API_KEYS = parse_limits(os.getenv("RATE_LIMIT_API_KEYS", ""))
+
+# GCRA in one round trip. KEYS[1] holds the theoretical arrival time (TAT)
+# in milliseconds; ARGV are the emission interval (period / count) and the
+# period, both in milliseconds. Returns {allowed, remaining, retry_after_ms}.
+_GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local tat = math.max(tonumber(redis.call("GET", KEYS[1])) or now, now)
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if now < allow_at then
+    return {0, 0, allow_at - now}
+end
+redis.call("SET", KEYS[1], new_tat, "PX", math.ceil(new_tat - now))
+return {1, math.floor((period - (new_tat - now)) / interval), 0}
+"""
+
+def _gcra(tat: Optional[float], now: float, limit: RateLimit) -> Tuple[bool, int, float, float]:
+    """The same algorithm in process: ``(allowed, remaining, retry_after, new_tat)``, in seconds."""
+    interval = limit.period / limit.count
+    new_tat = max(tat or now, now) + interval
+    allow_at = new_tat - limit.period
+    if now < allow_at:
+        return False, 0, allow_at - now, tat
+    return True, int((limit.period - (new_tat - now)) // interval), 0.0, new_tat
+
+class RateLimiter:
+    """Distributed rate limiter for FastAPI routes.
+
+    Each request costs one Redis script call (GCRA: a burst of ``count``
+    requests, then one every ``period / count``). Requests are counted per
+    route and per client: the configured API key when one is sent, the
+    client IP otherwise. When Redis is down or slow the limiter fails open
+    to the same algorithm in process, so limits still hold per worker.
+    Decorate routes that take a ``request: Request`` parameter with
+    ``@limiter.limit("5/minute")``.
+    """
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self._redis = None
+        self._script = None
+        self._redis_down_until = 0.0
+        self._local: Dict[str, float] = {}
+
+        # Counters behind stats()
+        self.allowed = 0
+        self.limited = 0
+        self.local_decisions = 0
+        self.redis_errors = 0
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        try:
+            self._redis = redis.from_url(
+                REDIS_URL,
+                socket_timeout=RATE_LIMIT_REDIS_TIMEOUT,
+                socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT
+            )
+            await self._redis.ping()
+            self._script = self._redis.register_script(_GCRA_SCRIPT)
+            logger.info(f"Rate limiter using Redis at {REDIS_URL}")
+        except Exception:
+            logger.warning("Redis not available - rate limits are enforced per process")
+            self._redis = None
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def identify(self, request: Request, route_limit: RateLimit) -> Tuple[str, RateLimit]:
+        """Client key and the limit that applies to it."""
+        api_key = request.headers.get(RATE_LIMIT_API_KEY_HEADER)
+        if api_key and api_key in RATE_LIMIT_API_KEYS:
+            return f"key:{api_key}", RATE_LIMIT_API_KEYS[api_key]
+        # Unknown keys are limited like anonymous callers, so rotating keys does not help
+        return f"ip:{request.client.host if request.client else 'unknown'}", route_limit
+
+    async def hit(self, key: str, limit: RateLimit) -> Tuple[bool, int, float]:
+        """Count one request against ``key``: ``(allowed, remaining, retry_after_seconds)``."""
+        if self._redis is not None and time.monotonic() >= self._redis_down_until:
+            try:
+                allowed, remaining, retry_after_ms = await self._script(
+                    keys=[f"ratelimit:{key}"],
+                    args=[limit.period * 1000 / limit.count, limit.period * 1000]
+                )
+                return bool(allowed), int(remaining), int(retry_after_ms) / 1000
+            except Exception as e:
+                self.redis_errors += 1
+                self._redis_down_until = time.monotonic() + RATE_LIMIT_REDIS_RETRY_SECONDS
+                logger.warning(f"Rate limiter Redis call failed, limiting per process for now: {str(e)}")
+
+        self.local_decisions += 1
+        now = time.monotonic()
+        allowed, remaining, retry_after, tat = _gcra(self._local.get(key), now, limit)
+        self._local[key] = tat
+        if len(self._local) > 10000:
+            # Forget clients whose allowance has fully recovered
+            self._local = {name: value for name, value in self._local.items() if value > now}
+        return allowed, remaining, retry_after
+
+    def limit(self, rate: str):
+        """Decorator limiting a route to ``rate`` per client, unless RATE_LIMIT_ROUTES overrides it."""
+        default = parse_rate(rate)
+
+        def decorator(endpoint):
+            @wraps(endpoint)
+            async def wrapper(*args, request: Request, **kwargs):
+                if self.enabled:
+                    route = request.scope.get("route")
+                    path = route.path if route else request.url.path
+                    client, limit = self.identify(request, RATE_LIMIT_ROUTES.get(path, default))
+                    allowed, _, retry_after = await self.hit(f"{path}:{client}", limit)
+                    if not allowed:
+                        self.limited += 1
+                        raise HTTPException(
+                            status_code=429,
+                            detail=f"Rate limit exceeded: {limit}",
+                            headers={"Retry-After": str(max(1, round(retry_after)))}
+                        )
+                    self.allowed += 1
+                return await endpoint(*args, request=request, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": "redis" if self._redis is not None and time.monotonic() >= self._redis_down_until else "local",
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "local_decisions": self.local_decisions,
+            "redis_errors": self.redis_errors,
+        }
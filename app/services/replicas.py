@@ -0,0 +1,293 @@
+import asyncio
+import random
+import socket
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+import httpx
+from app.core.config import logger
+
+# Successful requests needed before hedging starts, and how many are kept for the p95
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+class Replica:
+    """One service endpoint with its load, health and circuit-breaker state."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.container: Optional[str] = None
+        self.healthy = True
+        self.outstanding = 0
+        # Circuit breaker: open since ``opened_at``; one trial request at a time once it may close
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+        # Counters behind stats()
+        self.requests = 0
+        self.failures = 0
+        self.latency_ewma: Optional[float] = None
+
+    def available(self, now: float, open_seconds: float) -> bool:
+        if not self.healthy:
+            return False
+        if self.opened_at is None:
+            return True
+        return not self.probing and now - self.opened_at >= open_seconds
+
+    def state(self, now: float, open_seconds: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if now - self.opened_at >= open_seconds else "open"
+
+def _replica_fault(response: httpx.Response) -> bool:
+    """Whether a response says the replica failed.
+
+    A 503 with ``Retry-After`` is the shared upstream budget running out,
+    which every replica would answer alike.
+    """
+    if response.status_code == 503 and "Retry-After" in response.headers:
+        return False
+    return response.status_code >= 500
+
+class ReplicaPool:
+    """Client-side load balancing over the CoinGecko service replicas.
+
+    Replicas come from explicit URLs or, with ``resolve_dns``, from every
+    address their host name resolves to (one per container behind Docker's
+    DNS). A background task re-resolves them and polls ``/health``. Each
+    request goes to the healthy replica with the fewest requests in flight;
+    if it has not answered after the recent p95 latency, a hedged copy goes
+    to another replica and the first good response wins; an unhedged
+    request that fails is retried once on another replica. A replica failing
+    ``failure_threshold`` requests in a row is skipped for ``open_seconds``,
+    then gets a single trial request.
+    """
+
+    def __init__(
+        self,
+        get_client: Callable[[], httpx.AsyncClient],
+        urls: List[str],
+        resolve_dns: bool,
+        health_interval: float,
+        health_timeout: float,
+        failure_threshold: int,
+        open_seconds: float,
+        hedge: bool,
+        hedge_min_delay: float
+    ):
+        self.get_client = get_client
+        self.base_urls = urls
+        self.resolve_dns = resolve_dns
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.replicas: Dict[str, Replica] = {url: Replica(url) for url in urls}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+        # Counters behind stats()
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.retried = 0
+
+    async def _expand(self, url: str) -> List[str]:
+        """One URL per IPv4 address of the URL's host; https URLs are kept as they are."""
+        parts = urlsplit(url)
+        if not self.resolve_dns or parts.scheme != "http" or not parts.hostname:
+            return [url]
+        port = parts.port or 80
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                parts.hostname, port, family=socket.AF_INET, type=socket.SOCK_STREAM
+            )
+        except socket.gaierror as e:
+            logger.warning(f"Could not resolve {parts.hostname}: {str(e)}")
+            return [url]
+        addresses = sorted({info[4][0] for info in infos})
+        return [urlunsplit((parts.scheme, f"{address}:{port}", parts.path, "", "")) for address in addresses]
+
+    async def discover(self) -> None:
+        """Refresh the replica list, keeping the state of replicas that remain."""
+        urls = []
+        for base_url in self.base_urls:
+            urls.extend(url for url in await self._expand(base_url) if url not in urls)
+        added = [url for url in urls if url not in self.replicas]
+        removed = [url for url in self.replicas if url not in urls]
+        if added or removed:
+            logger.info(f"CoinGecko service replicas changed: added {added}, removed {removed}")
+        self.replicas = {url: self.replicas.get(url) or Replica(url) for url in urls}
+
+    async def check_health(self) -> None:
+        async def check(replica: Replica) -> None:
+            try:
+                response = await self.get_client().get(f"{replica.url}/health", timeout=self.health_timeout)
+                healthy = response.status_code == 200
+                if healthy:
+                    replica.container = response.json().get("container")
+            except Exception:
+                healthy = False
+            if healthy != replica.healthy:
+                logger.warning(f"CoinGecko replica {replica.url} ({replica.container}) is {'healthy' if healthy else 'unhealthy'}")
+            replica.healthy = healthy
+
+        await asyncio.gather(*(check(replica) for replica in list(self.replicas.values())))
+
+    async def run(self) -> None:
+        """Background task: rediscover replicas and poll their health until cancelled."""
+        while True:
+            try:
+                await self.discover()
+                await self.check_health()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"CoinGecko replica health check failed: {str(e)}")
+            await asyncio.sleep(self.health_interval)
+
+    def _pick(self, exclude: Optional[Replica] = None) -> Optional[Replica]:
+        """The available replica with the fewest requests in flight."""
+        now = time.monotonic()
+        candidates = [
+            replica for replica in self.replicas.values()
+            if replica is not exclude and replica.available(now, self.open_seconds)
+        ]
+        if not candidates:
+            if exclude is not None:
+                return None
+            # Every replica looks down; trying one beats failing outright
+            candidates = list(self.replicas.values())
+        # Among equally loaded replicas prefer the faster one; unmeasured ones get tried first
+        best = min((replica.outstanding, replica.latency_ewma or 0.0) for replica in candidates)
+        return random.choice([
+            replica for replica in candidates if (replica.outstanding, replica.latency_ewma or 0.0) == best
+        ])
+
+    def hedge_delay(self) -> Optional[float]:
+        """p95 of recent successful requests, or None while hedging is off or unmeasured."""
+        if not self.hedge or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return max(self.hedge_min_delay, ordered[int(len(ordered) * 0.95)])
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request to the pool; 4xx responses are returned, not retried."""
+        primary = self._pick()
+        first = asyncio.create_task(self._send(primary, method, path, kwargs))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._retry_failed(first, primary, method, path, kwargs)
+
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return await self._retry_failed(first, primary, method, path, kwargs)
+        backup = self._pick(exclude=primary)
+        if backup is None:
+            return await first
+
+        self.hedged += 1
+        second = asyncio.create_task(self._send(backup, method, path, kwargs))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and not _replica_fault(task.result()):
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+            # Both failed: surface the last failure
+            return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _retry_failed(
+        self, first: asyncio.Task, primary: Replica, method: str, path: str, kwargs: dict
+    ) -> httpx.Response:
+        """The primary's response, or one retry on another replica if the primary failed."""
+        try:
+            response = await first
+            if not _replica_fault(response):
+                return response
+            error = f"status {response.status_code}"
+        except httpx.TransportError as e:
+            error = str(e) or type(e).__name__
+        retry = self._pick(exclude=primary)
+        if retry is None:
+            return await first
+        self.retried += 1
+        logger.warning(f"CoinGecko replica {primary.url} failed ({error}), retrying on {retry.url}")
+        return await self._send(retry, method, path, kwargs)
+
+    async def _send(self, replica: Replica, method: str, path: str, kwargs: dict) -> httpx.Response:
+        trial = replica.opened_at is not None
+        replica.probing = replica.probing or trial
+        replica.outstanding += 1
+        replica.requests += 1
+        started = time.monotonic()
+        try:
+            response = await self.get_client().request(method, f"{replica.url}{path}", **kwargs)
+        except asyncio.CancelledError:
+            # Lost a hedge race, which says nothing about the replica
+            if trial:
+                replica.probing = False
+            raise
+        except httpx.HTTPError:
+            self._failed(replica)
+            raise
+        finally:
+            replica.outstanding -= 1
+
+        if _replica_fault(response):
+            self._failed(replica)
+        else:
+            self._succeeded(replica, time.monotonic() - started)
+        return response
+
+    def _failed(self, replica: Replica) -> None:
+        replica.failures += 1
+        replica.consecutive_failures += 1
+        # A failed trial reopens the breaker straight away
+        if replica.opened_at is not None or replica.consecutive_failures >= self.failure_threshold:
+            if replica.opened_at is None:
+                logger.warning(f"Circuit opened for CoinGecko replica {replica.url} ({replica.container})")
+            replica.opened_at = time.monotonic()
+            replica.probing = False
+
+    def _succeeded(self, replica: Replica, elapsed: float) -> None:
+        replica.consecutive_failures = 0
+        if replica.opened_at is not None:
+            logger.info(f"Circuit closed for CoinGecko replica {replica.url} ({replica.container})")
+            replica.opened_at = None
+            replica.probing = False
+        self.latencies.append(elapsed)
+        replica.latency_ewma = elapsed if replica.latency_ewma is None else 0.8 * replica.latency_ewma + 0.2 * elapsed
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        delay = self.hedge_delay()
+        return {
+            "hedge": self.hedge,
+            "hedge_delay_ms": delay * 1000 if delay is not None else None,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "retried": self.retried,
+            "replicas": [
+                {
+                    "url": replica.url,
+                    "container": replica.container,
+                    "healthy": replica.healthy,
+                    "circuit": replica.state(now, self.open_seconds),
+                    "outstanding": replica.outstanding,
+                    "requests": replica.requests,
+                    "failures": replica.failures,
+                    "latency_ms": replica.latency_ewma * 1000 if replica.latency_ewma is not None else None,
+                }
+                for replica in self.replicas.values()
+            ],
+        }
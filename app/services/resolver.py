@@ -0,0 +1,237 @@
+import asyncio
+import difflib
+import json
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.config import logger
+from app.services.coingecko import get_coin_list
+
+# On-disk copy of CoinGecko's coin list and how often to refresh it
+COIN_LIST_PATH = Path(os.getenv("COIN_LIST_PATH", "data/coin_list.json"))
+COIN_LIST_REFRESH_SECONDS = int(os.getenv("COIN_LIST_REFRESH_SECONDS", 86400))
+COIN_LIST_RETRY_SECONDS = int(os.getenv("COIN_LIST_RETRY_SECONDS", 60))
+
+# Minimum similarity (0-1) for a fuzzy match to be accepted
+COIN_FUZZY_THRESHOLD = float(os.getenv("COIN_FUZZY_THRESHOLD", 0.8))
+
+# Well-known coins. Their tickers and names are shared by many tokens on
+# CoinGecko, so these win over the coin list when a lookup is ambiguous.
+SEED_COINS = [
+    ("bitcoin", "btc", "Bitcoin"),
+    ("ethereum", "eth", "Ethereum"),
+    ("tether", "usdt", "Tether"),
+    ("binancecoin", "bnb", "BNB"),
+    ("solana", "sol", "Solana"),
+    ("ripple", "xrp", "XRP"),
+    ("usd-coin", "usdc", "USDC"),
+    ("dogecoin", "doge", "Dogecoin"),
+    ("cardano", "ada", "Cardano"),
+    ("tron", "trx", "TRON"),
+    ("avalanche-2", "avax", "Avalanche"),
+    ("shiba-inu", "shib", "Shiba Inu"),
+    ("the-open-network", "ton", "Toncoin"),
+    ("chainlink", "link", "Chainlink"),
+    ("polkadot", "dot", "Polkadot"),
+    ("bitcoin-cash", "bch", "Bitcoin Cash"),
+    ("litecoin", "ltc", "Litecoin"),
+    ("matic-network", "matic", "Polygon"),
+    ("near", "near", "NEAR Protocol"),
+    ("uniswap", "uni", "Uniswap"),
+    ("stellar", "xlm", "Stellar"),
+    ("monero", "xmr", "Monero"),
+    ("ethereum-classic", "etc", "Ethereum Classic"),
+    ("cosmos", "atom", "Cosmos Hub"),
+    ("dai", "dai", "Dai"),
+    ("wrapped-bitcoin", "wbtc", "Wrapped Bitcoin"),
+    ("pepe", "pepe", "Pepe"),
+    ("sui", "sui", "Sui"),
+    ("aptos", "apt", "Aptos"),
+    ("arbitrum", "arb", "Arbitrum"),
+    ("optimism", "op", "Optimism"),
+    ("filecoin", "fil", "Filecoin"),
+    ("internet-computer", "icp", "Internet Computer"),
+    ("hedera-hashgraph", "hbar", "Hedera"),
+    ("kaspa", "kas", "Kaspa"),
+]
+
+# Colloquial names that are neither a symbol nor the CoinGecko name
+ALIASES = {
+    "ether": "ethereum",
+    "xbt": "bitcoin",
+    "binance coin": "binancecoin",
+    "ripple": "ripple",
+    "avalanche": "avalanche-2",
+    "shiba": "shiba-inu",
+    "ton": "the-open-network",
+    "polygon": "matic-network",
+    "cosmos": "cosmos",
+    "hedera": "hedera-hashgraph",
+    "usd coin": "usd-coin",
+}
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse punctuation/whitespace for lookups."""
+    return " ".join(re.sub(r"[^a-z0-9.\-]+", " ", text.lower()).split())
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class CoinResolver:
+    """In-memory index from ids, symbols and names to CoinGecko coin ids.
+
+    Exact lookups are dict hits. Fuzzy lookups collect candidates through a
+    trigram index and rank them by edit similarity, and only return a match
+    that is both close enough and clearly better than the runner-up.
+    """
+
+    def __init__(self):
+        self._preferred: Dict[str, str] = {}
+        self._names_by_id: Dict[str, str] = {}
+        self._symbols_by_id: Dict[str, str] = {}
+        self._by_symbol: Dict[str, Set[str]] = defaultdict(set)
+        self._by_name: Dict[str, Set[str]] = defaultdict(set)
+        self._keys: List[Tuple[str, str]] = []
+        self._trigram_index: Dict[str, List[int]] = defaultdict(list)
+        self.loaded_at: Optional[float] = None
+        self.load([])
+
+    def load(self, coins: List[dict]) -> None:
+        """Rebuild the index from CoinGecko's ``/coins/list`` entries."""
+        preferred, names_by_id, symbols_by_id = {}, {}, {}
+        by_symbol, by_name = defaultdict(set), defaultdict(set)
+
+        for coin in coins:
+            coin_id = coin.get("id")
+            if not coin_id:
+                continue
+            names_by_id[coin_id] = coin.get("name") or coin_id
+            symbols_by_id[coin_id] = coin.get("symbol") or ""
+            by_symbol[normalize(coin.get("symbol") or "")].add(coin_id)
+            by_name[normalize(coin.get("name") or "")].add(coin_id)
+
+        for coin_id, symbol, name in SEED_COINS:
+            names_by_id.setdefault(coin_id, name)
+            symbols_by_id.setdefault(coin_id, symbol)
+            for key in (coin_id, symbol, normalize(name)):
+                preferred[key] = coin_id
+        preferred.update(ALIASES)
+
+        keys = {(coin_id, coin_id) for coin_id in names_by_id}
+        keys.update((normalize(name), coin_id) for coin_id, name in names_by_id.items())
+        keys.update(preferred.items())
+        keys = sorted(keys)
+        trigram_index = defaultdict(list)
+        for position, (key, _) in enumerate(keys):
+            for trigram in trigrams(key):
+                trigram_index[trigram].append(position)
+
+        # Swap everything in at once so lookups never see a half-built index
+        self._preferred, self._names_by_id, self._symbols_by_id = preferred, names_by_id, symbols_by_id
+        self._by_symbol, self._by_name = by_symbol, by_name
+        self._keys, self._trigram_index = keys, trigram_index
+        if coins:
+            self.loaded_at = time.time()
+        logger.info(f"Coin resolver indexed {len(names_by_id)} coins")
+
+    @property
+    def size(self) -> int:
+        return len(self._names_by_id)
+
+    def is_known(self, coin_id: str) -> bool:
+        return coin_id in self._names_by_id
+
+    def name(self, coin_id: str) -> Optional[str]:
+        """Display name of a coin id, if known."""
+        return self._names_by_id.get(coin_id)
+
+    def symbol(self, coin_id: str) -> Optional[str]:
+        """Ticker symbol of a coin id, if known."""
+        return self._symbols_by_id.get(coin_id)
+
+    def exact(self, text: str) -> Optional[str]:
+        """Resolve an id, symbol or name that maps to exactly one coin."""
+        key = normalize(text)
+        if not key:
+            return None
+        if key in self._preferred:
+            return self._preferred[key]
+        if key in self._names_by_id:
+            return key
+        for index in (self._by_symbol, self._by_name):
+            candidates = index.get(key)
+            if candidates and len(candidates) == 1:
+                return next(iter(candidates))
+        return None
+
+    def candidates(self, text: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Closest coin ids to ``text`` with their similarity, best first."""
+        key = normalize(text)
+        if not key:
+            return []
+
+        shared = Counter()
+        for trigram in trigrams(key):
+            shared.update(self._trigram_index.get(trigram, ()))
+
+        best: Dict[str, float] = {}
+        for position, _ in shared.most_common(50):
+            candidate_key, coin_id = self._keys[position]
+            score = difflib.SequenceMatcher(None, key, candidate_key).ratio()
+            if score > best.get(coin_id, 0.0):
+                best[coin_id] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def fuzzy(self, text: str) -> Optional[str]:
+        """Resolve a misspelled id or name when one coin is a clear match."""
+        ranked = self.candidates(text, limit=2)
+        if not ranked or ranked[0][1] < COIN_FUZZY_THRESHOLD:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < 0.05:
+            return None
+        return ranked[0][0]
+
+    def resolve(self, text: str) -> Optional[str]:
+        """Exact lookup first, then fuzzy; None when the input is ambiguous."""
+        return self.exact(text) or self.fuzzy(text)
+
+resolver = CoinResolver()
+
+def load_cached_coin_list() -> bool:
+    """Load the on-disk coin list; returns whether it is still fresh."""
+    if not COIN_LIST_PATH.exists():
+        return False
+    try:
+        resolver.load(json.loads(COIN_LIST_PATH.read_text()))
+    except Exception as e:
+        logger.error(f"Error reading coin list from {COIN_LIST_PATH}: {str(e)}")
+        return False
+    resolver.loaded_at = COIN_LIST_PATH.stat().st_mtime
+    return time.time() - resolver.loaded_at < COIN_LIST_REFRESH_SECONDS
+
+async def refresh_coin_list() -> bool:
+    """Fetch the coin list through the CoinGecko service and save it to disk."""
+    coins = await get_coin_list()
+    if not coins:
+        return False
+    resolver.load(coins)
+    try:
+        COIN_LIST_PATH.parent.mkdir(parents=True, exist_ok=True)
+        COIN_LIST_PATH.write_text(json.dumps(coins))
+    except Exception as e:
+        logger.error(f"Error writing coin list to {COIN_LIST_PATH}: {str(e)}")
+    return True
+
+async def keep_coin_list_fresh() -> None:
+    """Background task: load from disk, then refresh on a schedule."""
+    fresh = load_cached_coin_list()
+    while True:
+        if not fresh:
+            fresh = await refresh_coin_list()
+        delay = COIN_LIST_REFRESH_SECONDS if fresh else COIN_LIST_RETRY_SECONDS
+        await asyncio.sleep(delay)
+        fresh = False
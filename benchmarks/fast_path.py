@@ -0,0 +1,75 @@
+"""Benchmark the deterministic fast-path query parser.
+
+Runs the parser over a labelled corpus and reports the hit rate (queries
+parsed without the LLM), the accuracy of those hits, the parser's own cost
+and the LLM latency it saves.
+
+    python benchmarks/fast_path.py --llm-latency-ms 1000
+
+Pass ``--coin-list`` a saved ``/coins/list`` response to run against every
+CoinGecko coin; its thousands of tickers make far more words resolve than
+the built-in seed coins do.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+
+from app.core.config import logger  # noqa: E402
+from app.services.query_parser import parse_query  # noqa: E402
+from app.services.resolver import load_cached_coin_list, resolver  # noqa: E402
+
+CORPUS = Path(__file__).resolve().parent / "query_corpus.jsonl"
+
+def main(args):
+    logger.setLevel(logging.WARNING)
+    if args.coin_list:
+        resolver.load(json.loads(args.coin_list.read_text()))
+    else:
+        # Use the backend's cached coin list when present, otherwise the built-in seed coins
+        load_cached_coin_list()
+    corpus = [json.loads(line) for line in args.corpus.read_text().splitlines() if line.strip()]
+
+    hits = correct = 0
+    elapsed = 0.0
+    for item in corpus:
+        start = time.perf_counter()
+        analysis = parse_query(item["query"])
+        elapsed += time.perf_counter() - start
+        if analysis is None:
+            if args.verbose:
+                print(f"  LLM   {item['query']}")
+            continue
+        hits += 1
+        expected = (item["coin_id"], item.get("coin_ids", []), item["query_type"], item["days"])
+        got = (analysis.coin_id, analysis.coin_ids, analysis.query_type, analysis.days)
+        if got == expected:
+            correct += 1
+        else:
+            print(f"  WRONG {item['query']!r}: got {got}, expected {expected}")
+
+    total = len(corpus)
+    parse_us = elapsed / total * 1e6
+    saved_ms = hits * args.llm_latency_ms / total
+    print(f"queries:          {total}")
+    print(f"fast-path hits:   {hits} ({hits / total:.0%})")
+    print(f"hit accuracy:     {correct}/{hits} ({correct / hits if hits else 0:.0%})")
+    print(f"parser cost:      {parse_us:.1f} us/query")
+    print(f"LLM calls saved:  {hits}")
+    print(f"latency saved:    {saved_ms:.0f} ms/query on average "
+          f"(assuming {args.llm_latency_ms:.0f} ms per analysis call)")
+    return 0 if correct == hits else 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--llm-latency-ms", type=float, default=1000)
+    parser.add_argument("--coin-list", type=Path, help="JSON from CoinGecko's /coins/list to index instead")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list queries left to the LLM")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+"""Load test for the LLM path of the workflow.
+
+Runs the full graph against a stubbed model with artificial latency and
+reports latency percentiles as concurrency grows. With async LLM calls the
+p99 should stay close to the stub latency; with ``--blocking`` the stub
+sleeps synchronously, which reproduces the old event-loop stall.
+
+    python benchmarks/llm_load.py --latency-ms 1000 --levels 1,10,50,100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The cap must not be the bottleneck at the highest concurrency level
+os.environ.setdefault("LLM_MAX_CONCURRENCY", "128")
+# Exercise the LLM analyzer rather than the rule-based fast path
+os.environ.setdefault("FAST_PATH_ENABLED", "false")
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+
+from langchain_core.messages import AIMessage  # noqa: E402
+from app.graph.state import QueryAnalysis, CryptoReflection, ResponseFormat  # noqa: E402
+import app.graph.nodes as nodes  # noqa: E402
+import app.services.llm as llm  # noqa: E402
+from app.graph.workflow import create_workflow  # noqa: E402
+
+CANNED = {
+    QueryAnalysis: QueryAnalysis(coin_id="bitcoin", query_type="price", days=None),
+    CryptoReflection: CryptoReflection(refined_coin_id="bitcoin", sufficient=True, reasoning="stub"),
+    ResponseFormat: ResponseFormat(result="The current price of Bitcoin is $1.00."),
+}
+
+class StubStructuredModel:
+    def __init__(self, schema, latency: float, blocking: bool):
+        self.schema = schema
+        self.latency = latency
+        self.blocking = blocking
+
+    async def ainvoke(self, messages):
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        # Shaped like with_structured_output(include_raw=True)
+        return {"raw": AIMessage(content=""), "parsed": CANNED[self.schema], "parsing_error": None}
+
+class StubModel:
+    def __init__(self, latency: float, blocking: bool):
+        self.latency = latency
+        self.blocking = blocking
+
+    def with_structured_output(self, schema, include_raw: bool = False):
+        return StubStructuredModel(schema, self.latency, self.blocking)
+
+async def stub_price(coin_id: str) -> dict:
+    return {coin_id: {"usd": 1.0, "usd_24h_change": 0.0, "usd_market_cap": 1.0}}
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_level(graph, concurrency: int, requests_per_worker: int) -> list:
+    latencies = []
+
+    async def worker():
+        for _ in range(requests_per_worker):
+            start = time.perf_counter()
+            await graph.ainvoke({"query": "What's the price of bitcoin?"})
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+async def main(args):
+    llm.model = StubModel(args.latency_ms / 1000, args.blocking)
+    llm._structured_models.clear()
+    nodes.get_crypto_price = stub_price
+    graph = create_workflow()
+
+    print(f"stub latency {args.latency_ms}ms, 2 LLM calls per query, "
+          f"cap {llm.LLM_MAX_CONCURRENCY}, blocking={args.blocking}")
+    print(f"{'concurrency':>11} {'requests':>9} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+
+    p99s = {}
+    for level in args.levels:
+        start = time.perf_counter()
+        latencies = await run_level(graph, level, args.requests_per_worker)
+        elapsed = time.perf_counter() - start
+        p99s[level] = percentile(latencies, 99)
+        print(f"{level:>11} {len(latencies):>9} "
+              f"{statistics.median(latencies) * 1000:>9.1f} {p99s[level] * 1000:>9.1f} "
+              f"{len(latencies) / elapsed:>9.1f}")
+
+    baseline, worst = p99s[args.levels[0]], max(p99s.values())
+    flat = worst <= baseline * args.tolerance
+    print(f"p99 growth: {worst / baseline:.2f}x (tolerance {args.tolerance}x) -> {'FLAT' if flat else 'DEGRADED'}")
+    return 0 if flat else 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=1000)
+    parser.add_argument("--levels", type=lambda v: [int(x) for x in v.split(",")], default=[1, 10, 50, 100])
+    parser.add_argument("--requests-per-worker", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument("--blocking", action="store_true", help="simulate the old synchronous invoke()")
+    sys.exit(asyncio.run(main(parser.parse_args())))
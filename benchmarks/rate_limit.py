@@ -0,0 +1,103 @@
+"""Benchmark the overhead the rate limiter adds to each request.
+
+Serves a trivial FastAPI route with and without ``@limiter.limit`` over an
+in-process ASGI transport and reports the added latency per request, using
+the in-process fallback and, with ``--redis-url``, the Redis script (one
+round trip per request). The limit is set high enough that every request
+is allowed, so the numbers are the cost of the check alone.
+
+    python benchmarks/rate_limit.py --requests 5000 --redis-url redis://localhost:6379
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+
+from fastapi import FastAPI, Request  # noqa: E402
+
+from app.core.config import logger  # noqa: E402
+import app.services.rate_limit as rate_limit  # noqa: E402
+
+def build_app(limiter) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/open")
+    async def open_route(request: Request):
+        return {"ok": True}
+
+    @app.get("/limited")
+    @limiter.limit("1000000/minute")
+    async def limited_route(request: Request):
+        return {"ok": True}
+
+    return app
+
+async def measure(client: httpx.AsyncClient, path: str, requests: int, concurrency: int) -> dict:
+    """Per-request latency percentiles in microseconds, plus throughput."""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies) * 1e6,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "rps": requests / elapsed,
+    }
+
+async def run(args) -> int:
+    logger.setLevel(logging.WARNING)
+    backends = [("local", None)]
+    if args.redis_url:
+        backends.append(("redis", args.redis_url))
+
+    print(f"{'limiter':<8} {'route':<9} {'p50':>9} {'p99':>9} {'req/s':>9} {'added p50':>10}")
+    for name, redis_url in backends:
+        limiter = rate_limit.RateLimiter(enabled=True)
+        if redis_url:
+            rate_limit.REDIS_URL = redis_url
+            await limiter.start()
+            if limiter._redis is None:
+                print(f"Could not connect to {redis_url}")
+                return 1
+        app = build_app(limiter)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            # Warm up both routes (and load the script into Redis)
+            await measure(client, "/open", 100, args.concurrency)
+            await measure(client, "/limited", 100, args.concurrency)
+            baseline = await measure(client, "/open", args.requests, args.concurrency)
+            limited = await measure(client, "/limited", args.requests, args.concurrency)
+        for route, result in (("open", baseline), ("limited", limited)):
+            added = f"{result['p50'] - baseline['p50']:>8.0f}us" if route == "limited" else ""
+            print(
+                f"{name:<8} {route:<9} {result['p50']:>7.0f}us {result['p99']:>7.0f}us "
+                f"{result['rps']:>9.0f} {added:>10}"
+            )
+        print(f"{'':<8} stats: {limiter.stats()}")
+        await limiter.close()
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--redis-url", help="also measure the Redis-backed limiter against this Redis")
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,103 @@
+"""Benchmark the storage format of cached historical series.
+
+Compares the JSON envelope the service used to store with the columnar
+binary encoding, uncompressed and with each available compressor, on
+synthetic CoinGecko-shaped series. Reports the stored size, encode and
+decode time (to arrays for the binary format), and the cost of a cache hit
+(decode, slice and serialize the response). With ``--redis-url`` the size
+is Redis' own ``MEMORY USAGE`` and the hit includes the GET round trip.
+
+    python benchmarks/series_codec.py --days 1,90,365 --redis-url redis://localhost:6379
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "services" / "coingecko"))
+
+from codec import available_compression, decode_series_entry, encode_series_entry  # noqa: E402
+from series import DAY_MS, granularity, make_series, slice_series, to_market_chart  # noqa: E402
+
+STEP_MS = {"5m": 300_000, "hourly": 3_600_000, "daily": DAY_MS}
+
+def market_chart(days: int, seed: int = 0) -> dict:
+    """A random-walk series with CoinGecko's point spacing and shape for ``days`` days."""
+    rng = np.random.default_rng(seed)
+    step = STEP_MS[granularity(days)]
+    now = int(time.time() * 1000)
+    timestamps = now - np.arange(days * DAY_MS // step, -1, -1) * step
+    prices = 60000 * np.exp(np.cumsum(rng.normal(0, 0.002, len(timestamps))))
+    caps = prices * 19_700_000 * (1 + rng.normal(0, 1e-4, len(timestamps)))
+    volumes = 3e10 * np.exp(rng.normal(0, 0.2, len(timestamps)))
+    return {
+        field: [[int(t), float(v)] for t, v in zip(timestamps, values)]
+        for field, values in (("prices", prices), ("market_caps", caps), ("total_volumes", volumes))
+    }
+
+def timed(fn, repeat: int) -> float:
+    """Median wall time of ``fn`` in microseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+def main(args):
+    redis_client = None
+    if args.redis_url:
+        import redis
+        redis_client = redis.from_url(args.redis_url)
+        redis_client.ping()
+
+    formats = [("json", None), ("binary", "none")]
+    formats += [("binary", name) for name in ("zstd", "lz4") if available_compression(name) == name]
+
+    print(f"{'days':>5} {'points':>7} {'format':<12} {'size':>10} {'encode':>10} {'decode':>10} {'hit':>10}")
+    for days in args.days:
+        data = market_chart(days)
+        series = make_series(data, days)
+        key = f"bench:series:{days}"
+        for encoding, compression in formats:
+            label = encoding if encoding == "json" else f"{encoding}+{compression}"
+            if encoding == "json":
+                # The previous path: a JSON envelope around the market_chart lists
+                encode = lambda: json.dumps({"fetched_at": time.time(), "data": data})
+                decode = lambda raw: json.loads(raw)["data"]
+                respond = lambda raw: json.dumps(decode(raw))
+            else:
+                encode = lambda: encode_series_entry(series, encoding, compression)
+                decode = lambda raw: decode_series_entry(raw)[0]
+                respond = lambda raw: json.dumps(to_market_chart(slice_series(decode(raw), days)))
+            raw = encode()
+
+            if redis_client:
+                redis_client.set(key, raw)
+                size = redis_client.memory_usage(key)
+                read = lambda: redis_client.get(key)
+            else:
+                size = len(raw)
+                read = lambda: raw
+
+            encode_us = timed(encode, args.repeat)
+            decode_us = timed(lambda: decode(raw), args.repeat)
+            hit_us = timed(lambda: respond(read()), args.repeat)
+            print(
+                f"{days:>5} {len(data['prices']):>7} {label:<12} {size / 1024:>8.1f}KB "
+                f"{encode_us:>8.0f}us {decode_us:>8.0f}us {hit_us:>8.0f}us"
+            )
+        if redis_client:
+            redis_client.delete(key)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=lambda value: [int(day) for day in value.split(",")], default=[1, 30, 90, 365])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--redis-url", help="measure MEMORY USAGE and GET latency against this Redis")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,119 @@
+"""Benchmark the backend-to-CoinGecko-service hop.
+
+Starts a local keep-alive HTTP server that mimics ``/price/{coin_id}`` and
+counts accepted TCP connections, then compares a fresh ``httpx.AsyncClient``
+per call (the previous behaviour) with the shared pooled client.
+
+    python benchmarks/service_client.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+
+BODY = b'{"bitcoin": {"usd": 1.0, "usd_market_cap": 1.0, "usd_24h_change": 0.0}}'
+
+class CountingServer:
+    """Minimal HTTP/1.1 keep-alive server that counts connections."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.server = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                await reader.readuntil(b"\r\n\r\n")
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n" % len(BODY) + BODY
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+async def drive(fetch, requests: int, concurrency: int) -> list:
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            await fetch()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+def report(name: str, connections: int, latencies: list, elapsed: float):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(0.99 * (len(ordered) - 1)))]
+    print(f"{name:<18} {connections:>11} {statistics.median(latencies) * 1000:>9.2f} "
+          f"{p99 * 1000:>9.2f} {len(latencies) / elapsed:>9.0f}")
+
+async def main(args):
+    server = CountingServer(args.latency_ms / 1000)
+    url = await server.start()
+    os.environ["COINGECKO_SERVICE_URL"] = url
+    # Measure the connection pool itself: no L1 hits, no replica balancing in front of it
+    os.environ["COINGECKO_L1_ENABLED"] = "false"
+    os.environ["COINGECKO_REPLICA_POOL"] = "false"
+
+    import app.services.coingecko as coingecko
+    from app.core.config import logger
+
+    # Per-request INFO logging would dominate the numbers
+    logger.setLevel(logging.WARNING)
+
+    async def per_call_client():
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"{url}/price/bitcoin", timeout=10.0)
+            response.raise_for_status()
+            return response.json()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, server latency {args.latency_ms}ms")
+    print(f"{'mode':<18} {'connections':>11} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+
+    start = time.perf_counter()
+    latencies = await drive(per_call_client, args.requests, args.concurrency)
+    report("client per call", server.connections, latencies, time.perf_counter() - start)
+
+    server.connections = 0
+    await coingecko.start_client()
+    start = time.perf_counter()
+    latencies = await drive(lambda: coingecko.get_crypto_price("bitcoin"), args.requests, args.concurrency)
+    report("shared client", server.connections, latencies, time.perf_counter() - start)
+    await coingecko.close_client()
+
+    await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -35,6 +35,8 @@ st.markdown("""
 
 # Constants
 API_URL = os.getenv("API_URL", "http://localhost:8000")
+# Points per chart series requested from the backend; more would not be visible anyway
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", 500))
 
 def format_response_text(text: str) -> str:
     """Clean and format the response text"""
@@ -46,35 +48,63 @@ def format_response_text(text: str) -> str:
     text = re.sub(r'(\$)(\s+)', r'\1', text)
     return text
 
-def query_agent(query: str) -> dict:
-    """Send query to FastAPI backend"""
+# Progress messages shown while each workflow stage runs
+NODE_STATUS = {
+    "parse_query": "Understanding your question...",
+    "analyze_query": "Understanding your question...",
+    "fetch_data": "Fetching market data...",
+    "reflect": "Looking for the right coin...",
+    "analytics": "Crunching the numbers...",
+    "format_response": "Writing the answer...",
+    "fetch_coin": "Fetching market data...",
+    "format_comparison": "Writing the answer...",
+}
+
+def stream_agent(query: str):
+    """Send query to the FastAPI backend and yield (event, payload) pairs as they arrive"""
     try:
-        response = requests.post(
-            f"{API_URL}/query",
-            json={"query": query},
-            timeout=30
-        )
-        response.raise_for_status()
-        return response.json()
+        with requests.post(
+            f"{API_URL}/query/stream",
+            json={"query": query, "max_points": CHART_MAX_POINTS},
+            stream=True,
+            timeout=(5, 60)
+        ) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: ") and event:
+                    yield event, json.loads(line[len("data: "):])
+                    event = None
     except requests.exceptions.RequestException as e:
         st.error(f"Error communicating with the API: {str(e)}")
-        return None
+
+def historical_series(data: dict) -> dict:
+    """Chart series by name: one for a single coin, one per coin for a comparison"""
+    if "prices" in data:
+        return {"Price": data}
+    return {
+        coin_id: chart for coin_id, chart in data.items()
+        if isinstance(chart, dict) and "prices" in chart
+    }
 
 def plot_historical_data(data: dict) -> go.Figure:
     """Create a plotly figure for historical price data"""
-    df = pd.DataFrame(data["prices"], columns=["timestamp", "price"])
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-    
     fig = go.Figure()
-    fig.add_trace(
-        go.Scatter(
-            x=df["timestamp"],
-            y=df["price"],
-            mode="lines",
-            name="Price",
-            line=dict(color="#1f77b4", width=2)
+    series = historical_series(data)
+    for name, chart in series.items():
+        df = pd.DataFrame(chart["prices"], columns=["timestamp", "price"])
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
+        fig.add_trace(
+            go.Scatter(
+                x=df["timestamp"],
+                y=df["price"],
+                mode="lines",
+                name=name,
+                line=dict(width=2, **({"color": "#1f77b4"} if len(series) == 1 else {}))
+            )
         )
-    )
     
     fig.update_layout(
         title="Historical Price Data",
@@ -93,6 +123,7 @@ with st.sidebar:
     - What's the current price of Bitcoin?
     - Show me Ethereum's price history for the last 7 days
     - What's DOGE worth right now?
+    - Compare BTC, ETH and SOL over the last 30 days
     """)
     
     # API Status
@@ -115,24 +146,43 @@ query = st.text_input(
 )
 
 if query:
-    with st.spinner("Processing your query..."):
-        result = query_agent(query)
-        
-        if result:
-            # Display the AI response
-            st.markdown("### Response")
-            formatted_response = format_response_text(result["result"])
-            st.markdown(f'<div class="crypto-response">{formatted_response}</div>', unsafe_allow_html=True)
-            
-            # Display data visualization if it's historical data
-            if "prices" in result["data"]:
-                st.markdown("### Price Chart")
-                fig = plot_historical_data(result["data"])
-                st.plotly_chart(fig, use_container_width=True)
-            
-            # Display raw data in expander
-            with st.expander("View Raw Data"):
-                st.json(result["data"])
+    status = st.empty()
+    st.markdown("### Response")
+    response_box = st.empty()
+    chart_box = st.empty()
+    raw_box = st.empty()
+    status.info("Processing your query...")
+
+    text = ""
+    data = None
+    for event, payload in stream_agent(query):
+        if event == "node":
+            status.info(NODE_STATUS.get(payload["node"], "Processing your query..."))
+        elif event == "data" or event == "result":
+            # A comparison sends one data event per coin; the result carries all of them
+            data = {**(data or {}), **payload["data"]} if event == "data" else payload["data"]
+            # Display data visualization as soon as historical data arrives
+            if data and historical_series(data):
+                with chart_box.container():
+                    st.markdown("### Price Chart")
+                    st.plotly_chart(plot_historical_data(data), use_container_width=True)
+            if event == "result":
+                text = payload["result"]
+        elif event == "token":
+            text += payload["text"]
+        elif event == "error":
+            st.error(payload["error"])
+
+        if text:
+            # Display the AI response as it is written
+            formatted_response = format_response_text(text)
+            response_box.markdown(f'<div class="crypto-response">{formatted_response}</div>', unsafe_allow_html=True)
+    status.empty()
+
+    if data is not None:
+        # Display raw data in expander
+        with raw_box.expander("View Raw Data"):
+            st.json(data)
 
 # Footer
 st.markdown("---")
@@ -1,22 +1,78 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from typing import List, Optional
 from pydantic import BaseModel
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 from app.core.config import logger
+from app.core.metrics import MetricsMiddleware, StatsFields, register_stats, render_metrics
 from app.graph.state import CryptoAgentState
 from app.graph.workflow import create_workflow
+from app.services.coingecko import (
+    start_client,
+    close_client,
+    listen_for_invalidations,
+    l1_cache_stats,
+    replica_pool_stats,
+    get_crypto_prices,
+    ServiceUnavailable
+)
+from app.services.query_parser import parse_query as parse_query_rules
+from app.services.downsample import MIN_POINTS
+from app.services.resolver import keep_coin_list_fresh
+from app.services.rate_limit import RateLimiter
+from app.services.query_cache import (
+    start_query_cache,
+    close_query_cache,
+    normalize_query,
+    get_cached_result,
+    get_cached_analysis,
+    cache_result,
+    cache_analysis,
+    query_cache_stats
+)
+
+# Initialize rate limiter; limits are shared through Redis across workers and containers
+limiter = RateLimiter()
+
+# The counters behind /stats, also exported on /metrics
+STATS_SOURCES = {
+    "query_cache": query_cache_stats,
+    "coingecko_l1": l1_cache_stats,
+    "coingecko_replicas": replica_pool_stats,
+    "rate_limiter": limiter.stats
+}
+# Replicas are told apart by URL; their container can change behind it
+STATS_FIELDS = StatsFields(
+    labels=frozenset({"url"}),
+    states={"circuit": ("closed", "half_open", "open"), "backend": ("local", "redis")}
+)
+register_stats("crypto_agent", STATS_SOURCES, STATS_FIELDS)
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled client to the CoinGecko service for the lifetime of the app
+    await start_client()
+    await start_query_cache()
+    await limiter.start()
+    coin_list_task = asyncio.create_task(keep_coin_list_fresh())
+    invalidation_task = asyncio.create_task(listen_for_invalidations())
+    yield
+    invalidation_task.cancel()
+    coin_list_task.cancel()
+    await limiter.close()
+    await close_query_cache()
+    await close_client()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Crypto Price AI Agent",
     description="An AI agent that provides cryptocurrency price information using CoinGecko API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -27,13 +83,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Add rate limiter to app
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_middleware(MetricsMiddleware)
 
 class Query(BaseModel):
     query: str
+    # Downsample historical series to at most this many points per series
+    max_points: Optional[int] = None
+
+class BatchQuery(BaseModel):
+    queries: List[str]
+    max_points: Optional[int] = None
+
+# Limits of /query/batch: queries per request and workflows running at once
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 50))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+
+# Final state keys read back from the graph; only result and data are returned
+OUTPUT_KEYS = ["result", "data", "coin_id", "coin_ids", "query_type", "days", "fast_path", "fresh_for"]
 
 # Create the workflow graph
 graph = create_workflow()
@@ -44,7 +110,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     logger.error(f"HTTP error occurred: {exc.detail}")
     return JSONResponse(
         status_code=exc.status_code,
-        content={"error": exc.detail}
+        content={"error": exc.detail},
+        headers=exc.headers
     )
 
 @app.exception_handler(Exception)
@@ -55,25 +122,67 @@ async def general_exception_handler(request: Request, exc: Exception):
         content={"error": "An unexpected error occurred. Please try again later."}
     )
 
+def validate_query(query: Query) -> None:
+    if not query.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    if query.max_points is not None and query.max_points < MIN_POINTS:
+        raise HTTPException(status_code=400, detail=f"max_points must be at least {MIN_POINTS}")
+
+def service_unavailable(error: ServiceUnavailable) -> HTTPException:
+    """503 passing on when the CoinGecko service said to retry, if it did"""
+    return HTTPException(
+        status_code=503,
+        detail="The price service is unavailable, please try again shortly",
+        headers={"Retry-After": str(error.retry_after)} if error.retry_after else None
+    )
+
+async def remember_output(query: Query, output: dict) -> None:
+    """Cache the answer, and the analysis behind it when the LLM produced one"""
+    await cache_result(query.query, output, query.max_points)
+    if output.get("data") and not output.get("fast_path"):
+        await cache_analysis(
+            query.query, output["coin_id"], output["query_type"], output.get("days"), output.get("coin_ids")
+        )
+
+async def run_query(query: Query, prices: Optional[dict] = None) -> dict:
+    """Answer one query from the query cache or by running the workflow.
+
+    ``prices`` are spot prices already fetched for a batch, keyed by coin id.
+    """
+    # Serve repeated questions without the LLM or the service hop
+    cached_output = await get_cached_result(query.query, query.max_points)
+    if cached_output:
+        logger.info(f"Query cache HIT: {query.query}")
+        return cached_output
+    
+    # Run the graph
+    logger.info("Executing workflow")
+    try:
+        final_output = await graph.ainvoke(
+            {"query": query.query, "max_points": query.max_points, "prices": prices or {}},
+            output_keys=OUTPUT_KEYS
+        )
+    except ServiceUnavailable as e:
+        raise service_unavailable(e)
+    logger.info(f"Workflow completed: {final_output['result']}")
+    
+    await remember_output(query, final_output)
+    
+    return {"result": final_output["result"], "data": final_output["data"]}
+
 @app.post("/query")
-@limiter.limit("5/minute")  # Rate limit: 5 requests per minute per IP
+@limiter.limit("5/minute")  # Rate limit: 5 requests per minute per client (API key or IP)
 async def process_query(request: Request, query: Query):
     try:
         logger.info(f"Received query: {query.query}")
         
         # Input validation
-        if not query.query.strip():
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        validate_query(query)
             
         # Initialize the state
         state = CryptoAgentState(query=query.query)
         
-        # Run the graph
-        logger.info("Executing workflow")
-        final_output = await graph.ainvoke({"query": query.query})
-        logger.info(f"Workflow completed: {final_output}")
-        
-        return final_output
+        return await run_query(query)
             
     except HTTPException as e:
         # Re-raise HTTP exceptions to be handled by the exception handler
@@ -85,12 +194,170 @@ async def process_query(request: Request, query: Query):
             detail="An error occurred while processing your request"
         )
 
+async def prefetch_prices(queries: List[str]) -> dict:
+    """Fetch the spot prices a batch will need in one multi-coin request.
+
+    Coins are taken from queries the fast-path parser or the analysis cache
+    can resolve without the LLM. Returns the prices keyed by coin id; the
+    workflow runs are handed them, so this works with the L1 cache disabled.
+    """
+    coin_ids = set()
+    for text in queries:
+        analysis = parse_query_rules(text)
+        if analysis is not None:
+            if analysis.query_type == "price":
+                coin_ids.update(analysis.coin_ids or [analysis.coin_id])
+            continue
+        cached = await get_cached_analysis(text)
+        if cached and cached["query_type"] == "price":
+            coin_ids.update(cached.get("coin_ids") or [cached["coin_id"]])
+    if coin_ids:
+        logger.info(f"Prefetching prices for {len(coin_ids)} coins")
+        try:
+            return await get_crypto_prices(sorted(coin_ids))
+        except ServiceUnavailable as e:
+            # Each query still fetches, and reports, its own prices
+            logger.warning(f"Prefetching prices failed: {str(e)}")
+    return {}
+
+async def run_batch_item(query: Query, semaphore: asyncio.Semaphore, prices: dict) -> dict:
+    async with semaphore:
+        try:
+            validate_query(query)
+            return await run_query(query, prices)
+        except HTTPException as e:
+            return {"error": e.detail}
+        except Exception as e:
+            logger.error(f"Error processing batch query {query.query!r}: {str(e)}", exc_info=True)
+            return {"error": "An error occurred while processing this query"}
+
+@app.post("/query/batch")
+@limiter.limit("5/minute")  # One batch counts as one request
+async def process_batch(request: Request, batch: BatchQuery):
+    """Answer several queries at once.
+
+    Equivalent queries (same normalized text) run once, at most
+    BATCH_CONCURRENCY run at a time, and the spot prices they need are
+    fetched together up front. Each item gets either a result or an error.
+    """
+    logger.info(f"Received batch of {len(batch.queries)} queries")
+    if not batch.queries:
+        raise HTTPException(status_code=400, detail="queries cannot be empty")
+    if len(batch.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    
+    def dedupe_key(text: str) -> str:
+        # Text that normalizes to nothing (punctuation only) is only equivalent to itself
+        return normalize_query(text) or text
+    
+    unique = {}
+    for text in batch.queries:
+        unique.setdefault(dedupe_key(text), text)
+    logger.info(f"Batch has {len(unique)} distinct queries")
+    
+    prices = await prefetch_prices(list(unique.values()))
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    answers = await asyncio.gather(*(
+        run_batch_item(Query(query=text, max_points=batch.max_points), semaphore, prices)
+        for text in unique.values()
+    ))
+    by_key = dict(zip(unique, answers))
+    return {
+        "results": [{"query": text, **by_key[dedupe_key(text)]} for text in batch.queries]
+    }
+
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+async def stream_workflow(query: Query):
+    """Server-sent events for one query.
+
+    ``node`` fires as each workflow stage finishes, ``data`` carries the price
+    or (analysed, downsampled) historical data as soon as it is available,
+    once per coin of a comparison, keyed by coin id,
+    ``token`` carries the formatter's output as it is generated and
+    ``result`` ends the stream with the same body ``/query`` returns.
+    """
+    try:
+        cached_output = await get_cached_result(query.query, query.max_points)
+        if cached_output:
+            logger.info(f"Query cache HIT: {query.query}")
+            yield sse_event("data", {"data": cached_output["data"]})
+            yield sse_event("result", cached_output)
+            return
+        
+        logger.info("Streaming workflow")
+        final_output = {}
+        async for mode, chunk in graph.astream(
+            {"query": query.query, "max_points": query.max_points},
+            config={"configurable": {"stream_tokens": True}},
+            stream_mode=["updates", "custom"]
+        ):
+            if mode == "custom":
+                yield sse_event("token", {"text": chunk["token"]})
+                continue
+            for node, update in chunk.items():
+                update = update or {}
+                final_output.update(update)
+                yield sse_event("node", {"node": node})
+                # Parallel reflection sends the price it verified the coin with;
+                # historical data is sent once the analytics node has downsampled it
+                if node in ("fetch_data", "reflect") and update.get("current_price"):
+                    yield sse_event("data", {"data": update["current_price"]})
+                elif node == "analytics":
+                    yield sse_event("data", {"data": final_output["historical_price"]})
+                elif node == "fetch_coin":
+                    # Each coin of a comparison as soon as its own run finishes
+                    result = update["coin_results"][0]
+                    if result["data"] and final_output.get("query_type") == "price":
+                        yield sse_event("data", {"data": result["data"]})
+                    elif result["data"]:
+                        yield sse_event("data", {"data": {result["coin_id"]: result["data"]}})
+        
+        logger.info(f"Workflow completed: {final_output['result']}")
+        await remember_output(query, final_output)
+        yield sse_event("result", {"result": final_output["result"], "data": final_output["data"]})
+    except HTTPException as e:
+        logger.error(f"HTTP error occurred: {e.detail}")
+        yield sse_event("error", {"error": e.detail})
+    except ServiceUnavailable as e:
+        logger.error(f"CoinGecko service unavailable: {str(e)}")
+        yield sse_event("error", {"error": service_unavailable(e).detail, "retry_after": e.retry_after})
+    except Exception as e:
+        logger.error(f"Error streaming request: {str(e)}", exc_info=True)
+        yield sse_event("error", {"error": "An error occurred while processing your request"})
+
+@app.post("/query/stream")
+@limiter.limit("5/minute")  # Same limit as /query
+async def stream_query(request: Request, query: Query):
+    logger.info(f"Received streaming query: {query.query}")
+    validate_query(query)
+    return StreamingResponse(
+        stream_workflow(query),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Health check endpoint
 @app.get("/health")
 @limiter.limit("10/minute")  # Higher rate limit for health checks
 async def health_check(request: Request):
     return {"status": "healthy"}
 
+# Cache, service replica and rate limiter counters for this backend process
+@app.get("/stats")
+@limiter.limit("10/minute")
+async def stats(request: Request):
+    return {name: stats() for name, stats in STATS_SOURCES.items()}
+
+# Prometheus scrape endpoint: node, LLM, CoinGecko service and HTTP latencies plus the /stats counters.
+# Not rate limited, so scrapes never fail
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting server")
@@ -0,0 +1,93 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+from ratelimit import PRIORITY_BACKGROUND, PRIORITY_USER, upstream_priority
+
+class PriceBatcher:
+    """Merge concurrent single-coin price fetches into one upstream call.
+
+    Ids requested within ``window`` seconds of the first pending id are sent
+    together, or as soon as ``max_batch`` ids are pending. Each caller gets
+    ``{coin_id: price}`` for its own id, or ``{}`` if upstream did not know it.
+    The upstream call runs with user priority if any caller in the batch has it.
+    """
+
+    def __init__(self, fetch_many: Callable[[List[str]], Awaitable[dict]], window: float, max_batch: int):
+        self.fetch_many = fetch_many
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._enqueued_at: Dict[str, float] = {}
+        # Upstream priority of each pending id, user if any of its callers is a user
+        self._priority: Dict[str, str] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+        # Counters behind stats()
+        self.batches = 0
+        self.coins = 0
+        self.max_batch_size = 0
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+
+    async def get(self, coin_id: str) -> dict:
+        loop = asyncio.get_running_loop()
+        if upstream_priority.get() == PRIORITY_USER:
+            self._priority[coin_id] = PRIORITY_USER
+        else:
+            self._priority.setdefault(coin_id, PRIORITY_BACKGROUND)
+        future = self._pending.get(coin_id)
+        if future is None:
+            future = loop.create_future()
+            self._pending[coin_id] = future
+            self._enqueued_at[coin_id] = loop.time()
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, enqueued_at, priority = self._pending, self._enqueued_at, self._priority
+        self._pending, self._enqueued_at, self._priority = {}, {}, {}
+        if batch:
+            priority = PRIORITY_USER if PRIORITY_USER in priority.values() else PRIORITY_BACKGROUND
+            task = asyncio.create_task(self._run(batch, enqueued_at, priority))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[str, asyncio.Future], enqueued_at: Dict[str, float], priority: str) -> None:
+        # The task inherited the context of whichever caller started the flush
+        upstream_priority.set(priority)
+        now = asyncio.get_running_loop().time()
+        delays = [now - enqueued for enqueued in enqueued_at.values()]
+        self.batches += 1
+        self.coins += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.total_queue_delay += sum(delays)
+        self.max_queue_delay = max(self.max_queue_delay, max(delays))
+
+        try:
+            data = await self.fetch_many(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for coin_id, future in batch.items():
+            if not future.done():
+                future.set_result({coin_id: data[coin_id]} if coin_id in data else {})
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "coins": self.coins,
+            "avg_batch_size": self.coins / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "avg_queue_delay_ms": self.total_queue_delay / self.coins * 1000 if self.coins else 0.0,
+            "max_queue_delay_ms": self.max_queue_delay * 1000,
+        }
@@ -0,0 +1,62 @@
+import json
+import os
+import time
+from typing import Any, List, Optional, Tuple
+
+def parse_ttl_tiers(spec: str) -> List[Tuple[Optional[int], int]]:
+    """Parse "1:60,7:300,*:14400" into [(1, 60), (7, 300), (None, 14400)].
+
+    Each tier applies to ranges of up to that many days; "*" matches the rest.
+    """
+    tiers = []
+    for item in spec.split(","):
+        max_days, ttl = item.strip().split(":")
+        tiers.append((None if max_days == "*" else int(max_days), int(ttl)))
+    return sorted(tiers, key=lambda tier: float("inf") if tier[0] is None else tier[0])
+
+# Spot prices move constantly; history gets coarser (and changes less) with range
+PRICE_CACHE_TTL = int(os.getenv("PRICE_CACHE_TTL", 30))
+HISTORICAL_CACHE_TTL_TIERS = parse_ttl_tiers(
+    os.getenv("HISTORICAL_CACHE_TTL_TIERS", "1:60,7:300,30:900,90:1800,*:14400")
+)
+
+# The coin list only changes when coins are listed or delisted
+COIN_LIST_CACHE_TTL = int(os.getenv("COIN_LIST_CACHE_TTL", 86400))
+
+# Entries stay in Redis for this many extra fresh-TTLs and are served stale
+# while a background refresh runs
+CACHE_STALE_MULTIPLIER = float(os.getenv("CACHE_STALE_MULTIPLIER", 5))
+
+def price_ttl() -> int:
+    """Freshness window for spot price entries, in seconds."""
+    return PRICE_CACHE_TTL
+
+def historical_ttl(days: int) -> int:
+    """Freshness window for a historical range of ``days`` days, in seconds."""
+    for max_days, ttl in HISTORICAL_CACHE_TTL_TIERS:
+        if max_days is None or days <= max_days:
+            return ttl
+    return HISTORICAL_CACHE_TTL_TIERS[-1][1]
+
+def coin_list_ttl() -> int:
+    """Freshness window for the coin list, in seconds."""
+    return COIN_LIST_CACHE_TTL
+
+def redis_ttl(fresh_ttl: int) -> int:
+    """How long Redis keeps an entry: the fresh window plus the stale window."""
+    return max(1, int(fresh_ttl * (1 + CACHE_STALE_MULTIPLIER)))
+
+def encode_entry(data: Any) -> str:
+    """Wrap ``data`` with its fetch time for storage in Redis."""
+    return json.dumps({"fetched_at": time.time(), "data": data})
+
+def decode_entry(raw: bytes) -> Optional[Tuple[Any, float]]:
+    """Return the cached data and its age in seconds.
+
+    Entries written before fetch times were stored are plain JSON without
+    ``fetched_at``; they return None and count as misses.
+    """
+    entry = json.loads(raw)
+    if not isinstance(entry, dict) or "fetched_at" not in entry:
+        return None
+    return entry["data"], max(0.0, time.time() - entry["fetched_at"])
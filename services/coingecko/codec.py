@@ -0,0 +1,140 @@
+import json
+import os
+import struct
+import time
+from typing import Tuple
+import numpy as np
+from series import SERIES_FIELDS, make_series, to_market_chart
+
+# Optional compressors; entries record which one they used
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# "binary" stores columnar arrays, "json" the market_chart lists as before
+SERIES_ENCODING = os.getenv("SERIES_ENCODING", "binary").lower()
+# "zstd", "lz4" or "none"; falls back to "none" when the package is missing
+SERIES_COMPRESSION = os.getenv("SERIES_COMPRESSION", "zstd").lower()
+SERIES_ZSTD_LEVEL = int(os.getenv("SERIES_ZSTD_LEVEL", 3))
+
+MAGIC = b"CGS"
+VERSION = 1
+COMPRESSION_NONE, COMPRESSION_ZSTD, COMPRESSION_LZ4 = 0, 1, 2
+COMPRESSION_IDS = {"none": COMPRESSION_NONE, "zstd": COMPRESSION_ZSTD, "lz4": COMPRESSION_LZ4}
+
+# All fields share one timestamp column (the usual case for CoinGecko)
+FLAG_SHARED_TIMESTAMPS = 1
+
+# magic, version, compression, flags, fetched_at, span_days
+HEADER = struct.Struct("<3sBBBdI")
+# point count, first timestamp, byte width of the deltas that follow
+TIMESTAMPS_HEADER = struct.Struct("<IqB")
+
+def available_compression(name: str) -> str:
+    """``name`` if its package is installed, otherwise "none"."""
+    if name == "zstd" and zstandard is not None:
+        return "zstd"
+    if name == "lz4" and lz4_frame is not None:
+        return "lz4"
+    return "none"
+
+def _compress(payload: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdCompressor(level=SERIES_ZSTD_LEVEL).compress(payload)
+    if compression == COMPRESSION_LZ4:
+        return lz4_frame.compress(payload)
+    return payload
+
+def _decompress(payload: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if compression == COMPRESSION_LZ4:
+        return lz4_frame.decompress(payload)
+    return payload
+
+def _encode_timestamps(timestamps: np.ndarray) -> bytes:
+    if not len(timestamps):
+        return TIMESTAMPS_HEADER.pack(0, 0, 4)
+    deltas = np.diff(timestamps)
+    # Deltas of regularly spaced points fit in 32 bits up to ~24 days apart
+    width = 4 if not len(deltas) or (deltas.min() >= -2**31 and deltas.max() < 2**31) else 8
+    return TIMESTAMPS_HEADER.pack(len(timestamps), int(timestamps[0]), width) + deltas.astype(f"<i{width}").tobytes()
+
+def _decode_timestamps(buffer: bytes, offset: int) -> Tuple[np.ndarray, int]:
+    count, first, width = TIMESTAMPS_HEADER.unpack_from(buffer, offset)
+    offset += TIMESTAMPS_HEADER.size
+    timestamps = np.empty(count, dtype=np.int64)
+    if count:
+        deltas = np.frombuffer(buffer, dtype=f"<i{width}", count=count - 1, offset=offset)
+        offset += deltas.nbytes
+        timestamps[0] = first
+        np.cumsum(deltas, dtype=np.int64, out=timestamps[1:])
+        timestamps[1:] += first
+    return timestamps, offset
+
+def _decode_values(buffer: bytes, offset: int, count: int) -> Tuple[np.ndarray, int]:
+    values = np.frombuffer(buffer, dtype="<f8", count=count, offset=offset)
+    return values, offset + values.nbytes
+
+def encode_series_entry(series: dict, encoding: str = None, compression: str = None, fetched_at: float = None) -> bytes:
+    """Serialize a series with its fetch time for storage in Redis.
+
+    The binary layout is a fixed header followed by an optionally compressed
+    payload of columns: delta-encoded timestamps, then float64 values.
+    """
+    fetched_at = time.time() if fetched_at is None else fetched_at
+    if (encoding or SERIES_ENCODING) == "json":
+        data = {"span_days": series["span_days"], **to_market_chart(series)}
+        return json.dumps({"fetched_at": fetched_at, "data": data}).encode()
+
+    columns = [series[field] for field in SERIES_FIELDS]
+    shared = all(np.array_equal(columns[0][0], timestamps) for timestamps, _ in columns[1:])
+    parts = []
+    if shared:
+        parts.append(_encode_timestamps(columns[0][0]))
+        parts.extend(values.astype("<f8").tobytes() for _, values in columns)
+    else:
+        for timestamps, values in columns:
+            parts.append(_encode_timestamps(timestamps))
+            parts.append(values.astype("<f8").tobytes())
+
+    compression_id = COMPRESSION_IDS[available_compression(compression or SERIES_COMPRESSION)]
+    header = HEADER.pack(
+        MAGIC, VERSION, compression_id, FLAG_SHARED_TIMESTAMPS if shared else 0,
+        fetched_at, series["span_days"]
+    )
+    return header + _compress(b"".join(parts), compression_id)
+
+def decode_series_entry(raw: bytes) -> Tuple[dict, float]:
+    """Return the stored series, as arrays, and its age in seconds.
+
+    Also reads entries written with the JSON encoding.
+    """
+    if raw[:len(MAGIC)] != MAGIC:
+        entry = json.loads(raw)
+        data = entry["data"]
+        return make_series(data, data["span_days"]), max(0.0, time.time() - entry["fetched_at"])
+
+    _, version, compression, flags, fetched_at, span_days = HEADER.unpack_from(raw)
+    if version != VERSION:
+        raise ValueError(f"Unsupported series encoding version {version}")
+    payload = _decompress(raw[HEADER.size:], compression)
+
+    series = {"span_days": span_days}
+    if flags & FLAG_SHARED_TIMESTAMPS:
+        timestamps, offset = _decode_timestamps(payload, 0)
+        for field in SERIES_FIELDS:
+            values, offset = _decode_values(payload, offset, len(timestamps))
+            series[field] = (timestamps, values)
+    else:
+        offset = 0
+        for field in SERIES_FIELDS:
+            timestamps, offset = _decode_timestamps(payload, offset)
+            values, offset = _decode_values(payload, offset, len(timestamps))
+            series[field] = (timestamps, values)
+    return series, max(0.0, time.time() - fetched_at)
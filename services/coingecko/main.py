@@ -1,10 +1,14 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pycoingecko import CoinGeckoAPI
-import redis
-import json
+import httpx
+import redis.asyncio as redis
+import asyncio
+import math
 import os
+from functools import partial
 import logging
+from typing import List, Optional, Tuple
 import socket
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
@@ -49,14 +53,123 @@ logger.addHandler(console_handler)
 # Load environment variables
 load_dotenv()
 
+# Service modules read their settings from the environment at import time
+import upstream  # noqa: E402
+from singleflight import SingleFlight, RedisLock  # noqa: E402
+from batcher import PriceBatcher  # noqa: E402
+from cache import price_ttl, historical_ttl, coin_list_ttl, redis_ttl, encode_entry, decode_entry  # noqa: E402
+from series import series_key, make_series, slice_series, merge_series, tail_request, to_market_chart, downsample_series  # noqa: E402
+from codec import encode_series_entry, decode_series_entry  # noqa: E402
+from warmer import CacheWarmer  # noqa: E402
+from metrics import CACHE_LOOKUPS, MetricsMiddleware, register_stats, render_metrics  # noqa: E402
+from ratelimit import (  # noqa: E402
+    UpstreamRateLimiter,
+    UpstreamRateLimited,
+    background_context,
+    UPSTREAM_RATE_LIMIT,
+    UPSTREAM_BURST,
+    UPSTREAM_BACKGROUND_RESERVE,
+    UPSTREAM_BACKOFF_BASE,
+    UPSTREAM_BACKOFF_MAX
+)
+
 # Get port from environment variable
 PORT = int(os.getenv("PORT", 8001))
 
+# Redis connection pool size per replica, and how long a command waits for a free connection
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 100))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+
+# Smallest max_points accepted by /historical: first, last and one min/max bucket
+HISTORICAL_MIN_POINTS = 4
+
+# Upper bound on ids accepted by /prices in one request
+PRICES_MAX_IDS = int(os.getenv("PRICES_MAX_IDS", 250))
+
+# Optional micro-batching of single-coin price misses; a window of 0 disables it
+PRICE_BATCH_WINDOW_MS = float(os.getenv("PRICE_BATCH_WINDOW_MS", 0))
+PRICE_BATCH_MAX_SIZE = int(os.getenv("PRICE_BATCH_MAX_SIZE", 100))
+
+# Cache-miss coalescing: "local" per replica, "redis" also across replicas, "off" to disable
+SINGLEFLIGHT_MODE = os.getenv("SINGLEFLIGHT_MODE", "local").lower()
+SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", 20))
+SINGLEFLIGHT_WAIT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_WAIT_TIMEOUT", 15))
+SINGLEFLIGHT_POLL_INTERVAL = float(os.getenv("SINGLEFLIGHT_POLL_INTERVAL", 0.05))
+
+# Keys written to Redis are announced here so backend L1 caches can drop them; empty disables
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+
+# Background refresh of the most requested entries before they expire
+WARMER_ENABLED = os.getenv("WARMER_ENABLED", "true").lower() == "true"
+WARMER_INTERVAL = float(os.getenv("WARMER_INTERVAL", 10))
+WARMER_TOP_K = int(os.getenv("WARMER_TOP_K", 50))
+# Sketch counts are multiplied by this every interval, so hotness follows recent traffic
+WARMER_DECAY = float(os.getenv("WARMER_DECAY", 0.8))
+# Keys with a lower (decayed, summed over replicas) request count are not warmed
+WARMER_MIN_SCORE = float(os.getenv("WARMER_MIN_SCORE", 3))
+# Upstream calls one warming cycle may make; a price call covers up to PRICES_MAX_IDS coins
+WARMER_UPSTREAM_BUDGET = int(os.getenv("WARMER_UPSTREAM_BUDGET", 5))
+WARMER_SKETCH_WIDTH = int(os.getenv("WARMER_SKETCH_WIDTH", 4096))
+WARMER_SKETCH_DEPTH = int(os.getenv("WARMER_SKETCH_DEPTH", 4))
+
+# Initialized in the lifespan; stays None when Redis is unreachable
+redis_client = None
+
+singleflight = SingleFlight()
+
+# Keeps references to stale-while-revalidate refreshes until they finish
+background_tasks = set()
+
+def upstream_busy(error: UpstreamRateLimited) -> HTTPException:
+    """503 telling the client when an upstream token should be free again."""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global redis_client
+    redis_url = os.getenv("REDIS_URL", "redis://redis:6379")
+    try:
+        # A plain pool raises "Too many connections" once exhausted; this one queues the command
+        pool = redis.BlockingConnectionPool.from_url(
+            redis_url, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT
+        )
+        redis_client = redis.Redis(connection_pool=pool)
+        await redis_client.ping()
+        logger.info(f"Redis client initialized with URL: {redis_url}")
+    except Exception:
+        logger.warning("Redis not available - continuing without caching")
+        redis_client = None
+    if redis_client and UPSTREAM_RATE_LIMIT > 0:
+        upstream.rate_limiter = UpstreamRateLimiter(
+            redis_client,
+            UPSTREAM_RATE_LIMIT,
+            UPSTREAM_BURST,
+            UPSTREAM_BACKGROUND_RESERVE,
+            UPSTREAM_BACKOFF_BASE,
+            UPSTREAM_BACKOFF_MAX
+        )
+    await upstream.start_client()
+    warmer_task = None
+    if warmer and redis_client:
+        # Warming calls yield upstream tokens to user cache misses
+        warmer_task = asyncio.create_task(warmer.run(redis_client, HOSTNAME), context=background_context())
+    yield
+    if warmer_task:
+        warmer_task.cancel()
+    await upstream.close_client()
+    if redis_client:
+        await redis_client.aclose(close_connection_pool=True)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="CoinGecko Service",
     description="Microservice for CoinGecko API interactions with caching",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -67,18 +180,302 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-# Initialize CoinGecko API client
-coingecko = CoinGeckoAPI()
+async def fetch_prices(coin_ids: List[str]) -> dict:
+    """Fetch spot prices for several coins in one CoinGecko call and cache each one.
 
-# Initialize Redis
-redis_client = None
-try:
-    redis_url = os.getenv("REDIS_URL", "redis://redis:6379")
-    redis_client = redis.from_url(redis_url)
-    redis_client.ping()
-except:
-    print("Redis not available - continuing without caching")
+    Unknown ids are simply absent from the result.
+    """
+    logger.info(f"[Container: {HOSTNAME}] Fetching price data from CoinGecko API - coin_ids: {','.join(coin_ids)}")
+    data = await upstream.get_price(",".join(coin_ids))
+
+    if redis_client and data:
+        ttl = redis_ttl(price_ttl())
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for coin_id, price in data.items():
+                pipe.setex(f"price:{coin_id}", ttl, encode_entry({coin_id: price}))
+            if CACHE_INVALIDATION_CHANNEL:
+                pipe.publish(CACHE_INVALIDATION_CHANNEL, " ".join(f"price:{coin_id}" for coin_id in data))
+            await pipe.execute()
+        logger.info(f"[Container: {HOSTNAME}] Cached price data for coin_ids: {','.join(data)}")
+
+    return data
+
+# Merges single-coin misses into fetch_prices calls when a window is configured
+price_batcher = (
+    PriceBatcher(fetch_prices, PRICE_BATCH_WINDOW_MS / 1000, PRICE_BATCH_MAX_SIZE)
+    if PRICE_BATCH_WINDOW_MS > 0 else None
+)
+
+async def fetch_price(coin_id: str) -> dict:
+    """Fetch spot price from CoinGecko and cache it."""
+    if price_batcher:
+        data = await price_batcher.get(coin_id)
+    else:
+        data = await fetch_prices([coin_id])
+
+    if not data:
+        logger.error(f"[Container: {HOSTNAME}] No data found for coin_id: {coin_id}")
+        raise HTTPException(status_code=404, detail=f"No data found for coin: {coin_id}")
+
+    return data
+
+async def fetch_historical(coin_id: str, days: int, cache_key: str) -> dict:
+    """Fetch ``days`` days of history from CoinGecko and merge them into the coin's series."""
+    logger.info(f"Fetching historical data from CoinGecko API - coin_id: {coin_id}, days: {days}")
+    try:
+        data = await upstream.get_coin_market_chart_by_id(coin_id, days)
+    except httpx.HTTPStatusError as e:
+        # CoinGecko answers 404 for coin ids it does not know
+        if e.response.status_code != 404:
+            raise
+        data = None
+
+    if not data or not data.get("prices"):
+        logger.error(f"No historical data found for coin_id: {coin_id}")
+        raise HTTPException(status_code=404, detail=f"No historical data found for coin: {coin_id}")
+
+    return await store_series(coin_id, cache_key, make_series(data, days))
+
+async def refresh_historical(coin_id: str, cache_key: str, series: dict, age: float) -> dict:
+    """Bring a stored series up to date by fetching only the points it is missing."""
+    request = tail_request(series["span_days"], age)
+    if request is None:
+        return await fetch_historical(coin_id, series["span_days"], cache_key)
+
+    days, interval = request
+    logger.info(
+        f"Fetching historical tail from CoinGecko API - coin_id: {coin_id}, days: {days} "
+        f"of {series['span_days']}"
+    )
+    data = await upstream.get_coin_market_chart_by_id(coin_id, days, interval)
+    if not data or not data.get("prices"):
+        logger.error(f"No historical data found for coin_id: {coin_id}")
+        return series
+
+    return await store_series(coin_id, cache_key, make_series(data, days))
+
+async def store_series(coin_id: str, cache_key: str, series: dict) -> dict:
+    """Merge ``series`` into the stored one, so the longest range fetched so far is kept."""
+    if not redis_client:
+        return series
+
+    cached_data = await redis_client.get(cache_key)
+    if cached_data:
+        series = merge_series(decode_series_entry(cached_data)[0], series)
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.setex(cache_key, redis_ttl(historical_ttl(series["span_days"])), encode_series_entry(series))
+        if CACHE_INVALIDATION_CHANNEL:
+            # Every range of this coin is sliced from the series
+            pipe.publish(CACHE_INVALIDATION_CHANNEL, f"historical:{coin_id}:*")
+        await pipe.execute()
+    logger.info(f"Cached historical series for coin_id: {coin_id}, span: {series['span_days']} days")
+
+    return series
+
+async def fetch_coins_list(cache_key: str) -> list:
+    """Fetch the full coin list from CoinGecko and cache it."""
+    logger.info(f"[Container: {HOSTNAME}] Fetching coin list from CoinGecko API")
+    data = await upstream.get_coins_list()
+
+    if redis_client:
+        await redis_client.setex(cache_key, redis_ttl(coin_list_ttl()), encode_entry(data))
+        logger.info(f"[Container: {HOSTNAME}] Cached coin list with {len(data)} coins")
+
+    return data
+
+def decode_data(raw: bytes):
+    entry = decode_entry(raw)
+    return entry[0] if entry else None
+
+async def coalesced_fetch(cache_key: str, fetch, wait: bool = True, decode=decode_data):
+    """Run ``fetch`` for a cache miss at most once per key at a time.
+
+    Concurrent misses on this replica share one call. In "redis" mode the
+    replicas also agree on a single fetcher through a lock; the others wait
+    for it to fill the cache and read the value from there with ``decode``,
+    or return None straight away when ``wait`` is False.
+    """
+    if SINGLEFLIGHT_MODE == "off":
+        return await fetch()
+    return await singleflight.do(cache_key, lambda: fetch_across_replicas(cache_key, fetch, wait, decode))
+
+async def fetch_across_replicas(cache_key: str, fetch, wait: bool = True, decode=decode_data):
+    if SINGLEFLIGHT_MODE != "redis" or not redis_client:
+        return await fetch()
+
+    lock = RedisLock(redis_client, f"lock:{cache_key}", SINGLEFLIGHT_LOCK_TTL)
+    if await lock.acquire():
+        try:
+            return await fetch()
+        finally:
+            await lock.release()
+    if not wait:
+        return None
+
+    logger.info(f"[Container: {HOSTNAME}] Waiting for another replica to fill {cache_key}")
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SINGLEFLIGHT_WAIT_TIMEOUT
+    while loop.time() < deadline:
+        await asyncio.sleep(SINGLEFLIGHT_POLL_INTERVAL)
+        cached_data = await redis_client.get(cache_key)
+        value = decode(cached_data) if cached_data else None
+        if value is not None:
+            return value
+        if not await lock.held():
+            break
+
+    # The other replica failed or timed out; check once more, then fetch ourselves
+    cached_data = await redis_client.get(cache_key)
+    value = decode(cached_data) if cached_data else None
+    if value is not None:
+        return value
+    return await fetch()
+
+def refresh_in_background(cache_key: str, fetch) -> None:
+    """Refresh a stale entry without making the current caller wait for it."""
+    if singleflight.in_flight(cache_key):
+        return
+    task = asyncio.create_task(coalesced_fetch(cache_key, fetch, wait=False), context=background_context())
+    background_tasks.add(task)
+    task.add_done_callback(lambda t: finish_background_refresh(cache_key, t))
+
+def finish_background_refresh(cache_key: str, task: asyncio.Task) -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"[Container: {HOSTNAME}] Background refresh failed for {cache_key}: {task.exception()}")
+
+async def cached_fetch(cache_key: str, fresh_ttl: int, fetch, response: Response, description: str):
+    """Serve ``cache_key`` from Redis with stale-while-revalidate semantics.
+
+    Fresh entries are returned as is. Entries past ``fresh_ttl`` but still in
+    Redis are returned immediately while a background task refreshes them.
+    Misses wait for a (coalesced) upstream fetch. The ``Age`` and ``X-Cache``
+    headers tell the caller how fresh the returned data is.
+    """
+    kind = cache_key.split(":")[0]
+    if redis_client:
+        cached_data = await redis_client.get(cache_key)
+        entry = decode_entry(cached_data) if cached_data else None
+
+        if entry:
+            data, age = entry
+            if age < fresh_ttl:
+                logger.info(f"[Container: {HOSTNAME}] ✅ Cache HIT for {description}")
+                CACHE_LOOKUPS.labels(kind, "hit").inc()
+                set_cache_headers(response, "HIT", age, fresh_ttl)
+                return data
+
+            logger.info(f"[Container: {HOSTNAME}] ♻️ Cache STALE for {description}, age: {age:.0f}s - refreshing in background")
+            CACHE_LOOKUPS.labels(kind, "stale").inc()
+            refresh_in_background(cache_key, fetch)
+            set_cache_headers(response, "STALE", age, fresh_ttl)
+            return data
+
+        logger.info(f"[Container: {HOSTNAME}] ❌ Cache MISS for {description}")
+        CACHE_LOOKUPS.labels(kind, "miss").inc()
+
+    data = await coalesced_fetch(cache_key, fetch)
+    set_cache_headers(response, "MISS", 0, fresh_ttl)
+    return data
+
+def set_cache_headers(response: Response, status: str, age: float, fresh_ttl: int) -> None:
+    response.headers["X-Cache"] = status
+    response.headers["Age"] = str(int(age))
+    response.headers["Cache-Control"] = f"max-age={max(0, int(fresh_ttl - age))}"
+
+async def warm_hot_keys(hot: List[Tuple[str, float]]) -> dict:
+    """Refresh hot entries that would go stale before the next warming cycle.
+
+    ``hot`` holds ``price:{coin_id}`` and ``historical:{coin_id}:{days}``
+    keys, hottest first. Missing prices are fetched too, all in
+    PRICES_MAX_IDS-sized upstream calls; each historical series costs one
+    call. Calls beyond WARMER_UPSTREAM_BUDGET wait for a later cycle.
+    """
+    budget = WARMER_UPSTREAM_BUDGET
+    counts = {"prices": 0, "series": 0, "over_budget": 0, "rate_limited": 0}
+
+    coin_ids = [key.split(":", 1)[1] for key, _ in hot if key.startswith("price:")]
+    if coin_ids:
+        due = []
+        for coin_id, cached_data in zip(coin_ids, await redis_client.mget([f"price:{coin_id}" for coin_id in coin_ids])):
+            entry = decode_entry(cached_data) if cached_data else None
+            if not entry or entry[1] + WARMER_INTERVAL >= price_ttl():
+                due.append(coin_id)
+        for start in range(0, len(due), PRICES_MAX_IDS):
+            if budget <= 0:
+                counts["over_budget"] += 1
+                continue
+            budget -= 1
+            try:
+                data = await fetch_prices(due[start:start + PRICES_MAX_IDS])
+            except UpstreamRateLimited:
+                counts["rate_limited"] += 1
+                continue
+            counts["prices"] += len(data or {})
+
+    # One entry per stored series: the longest hot range and the shortest freshness window
+    ranges = {}
+    for key, _ in hot:
+        if not key.startswith("historical:"):
+            continue
+        _, coin_id, days = key.split(":")
+        days = int(days)
+        cache_key = series_key(coin_id, days)
+        _, longest, fresh_ttl = ranges.get(cache_key, (coin_id, 0, historical_ttl(days)))
+        ranges[cache_key] = (coin_id, max(longest, days), min(fresh_ttl, historical_ttl(days)))
+
+    refreshes = []
+    if ranges:
+        cached = await redis_client.mget(list(ranges))
+        for (cache_key, (coin_id, days, fresh_ttl)), cached_data in zip(ranges.items(), cached):
+            series, age = decode_series_entry(cached_data) if cached_data else (None, 0.0)
+            covered = series is not None and series["span_days"] >= days
+            if covered and age + WARMER_INTERVAL < fresh_ttl:
+                continue
+            if budget <= 0:
+                counts["over_budget"] += 1
+                continue
+            budget -= 1
+            if covered:
+                fetch = partial(refresh_historical, coin_id, cache_key, series, age)
+            else:
+                fetch = partial(fetch_historical, coin_id, days, cache_key)
+            refreshes.append(coalesced_fetch(cache_key, fetch, wait=False))
+
+    for result in await asyncio.gather(*refreshes, return_exceptions=True):
+        if isinstance(result, UpstreamRateLimited):
+            counts["rate_limited"] += 1
+        elif isinstance(result, Exception):
+            logger.error(f"[Container: {HOSTNAME}] Warming a historical series failed: {str(result)}")
+        elif result is not None:
+            counts["series"] += 1
+    return counts
+
+warmer = CacheWarmer(
+    warm_hot_keys,
+    WARMER_INTERVAL,
+    WARMER_TOP_K,
+    WARMER_DECAY,
+    WARMER_MIN_SCORE,
+    WARMER_SKETCH_WIDTH,
+    WARMER_SKETCH_DEPTH
+) if WARMER_ENABLED else None
+
+# The counters behind /stats, also exported on /metrics
+STATS_SOURCES = {
+    "price_batcher": lambda: price_batcher.stats() if price_batcher else None,
+    "warmer": lambda: warmer.stats() if warmer else None,
+    "upstream_rate_limiter": lambda: upstream.rate_limiter.stats() if upstream.rate_limiter else None
+}
+register_stats("coingecko_service", STATS_SOURCES)
+
+def track_request(key: str) -> None:
+    """Count a served request towards the warmer's hot keys."""
+    if warmer:
+        warmer.record(key)
 
 @app.get("/health")
 async def health_check():
@@ -88,73 +485,193 @@ async def health_check():
         "container": HOSTNAME
     }
 
+@app.get("/stats")
+async def stats():
+    """Runtime counters for this replica."""
+    return {"container": HOSTNAME, **{name: stats() for name, stats in STATS_SOURCES.items()}}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: request, cache and upstream metrics plus the /stats counters."""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 @app.get("/price/{coin_id}")
-async def get_crypto_price(coin_id: str):
+async def get_crypto_price(coin_id: str, response: Response):
     """Get current price for a cryptocurrency."""
     try:
         logger.info(f"[Container: {HOSTNAME}] Processing price request for coin_id: {coin_id}")
-        
-        if redis_client:
-            cache_key = f"price:{coin_id}"
-            cached_data = redis_client.get(cache_key)
-            
-            if cached_data:
-                logger.info(f"[Container: {HOSTNAME}] ✅ Cache HIT for price data - coin_id: {coin_id}")
-                return json.loads(cached_data)
-            
-            logger.info(f"[Container: {HOSTNAME}] ❌ Cache MISS for price data - coin_id: {coin_id}")
-        
-        logger.info(f"[Container: {HOSTNAME}] Fetching price data from CoinGecko API - coin_id: {coin_id}")
-        data = coingecko.get_price(
-            ids=coin_id,
-            vs_currencies='usd',
-            include_market_cap=True,
-            include_24hr_change=True
+
+        cache_key = f"price:{coin_id}"
+        data = await cached_fetch(
+            cache_key,
+            price_ttl(),
+            lambda: fetch_price(coin_id),
+            response,
+            f"price data - coin_id: {coin_id}"
         )
-        
-        if not data:
-            logger.error(f"[Container: {HOSTNAME}] No data found for coin_id: {coin_id}")
-            raise HTTPException(status_code=404, detail=f"No data found for coin: {coin_id}")
-            
-        if redis_client:
-            redis_client.setex(cache_key, 60, json.dumps(data))
-            logger.info(f"[Container: {HOSTNAME}] Cached price data for coin_id: {coin_id}")
-            
+        track_request(cache_key)
         return data
+    except HTTPException:
+        raise
+    except UpstreamRateLimited as e:
+        logger.warning(f"[Container: {HOSTNAME}] Upstream rate limit reached fetching price for {coin_id}: {str(e)}")
+        raise upstream_busy(e)
     except Exception as e:
         logger.error(f"[Container: {HOSTNAME}] Error fetching price for {coin_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/prices")
+async def get_crypto_prices(ids: str, response: Response):
+    """Get current prices for several cryptocurrencies, e.g. ``/prices?ids=bitcoin,ethereum``.
+
+    All cache keys are read with one MGET and only the missing ids are
+    fetched, in a single upstream call. Stale entries are returned and
+    refreshed together in the background. Unknown ids are left out.
+    """
+    coin_ids = list(dict.fromkeys(coin_id.strip() for coin_id in ids.split(",") if coin_id.strip()))
+    if not coin_ids:
+        raise HTTPException(status_code=400, detail="ids must contain at least one coin id")
+    if len(coin_ids) > PRICES_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {PRICES_MAX_IDS} ids per request")
+
+    try:
+        logger.info(f"[Container: {HOSTNAME}] Processing batch price request for {len(coin_ids)} coins")
+        fresh_ttl = price_ttl()
+        result, missing, stale, oldest = {}, [], [], 0.0
+
+        if redis_client:
+            cached = await redis_client.mget([f"price:{coin_id}" for coin_id in coin_ids])
+            for coin_id, cached_data in zip(coin_ids, cached):
+                entry = decode_entry(cached_data) if cached_data else None
+                if not entry:
+                    missing.append(coin_id)
+                    continue
+                data, age = entry
+                result.update(data)
+                oldest = max(oldest, age)
+                if age >= fresh_ttl:
+                    stale.append(coin_id)
+        else:
+            missing = coin_ids
+
+        hits = len(coin_ids) - len(missing) - len(stale)
+        logger.info(
+            f"[Container: {HOSTNAME}] Batch price cache - hits: {hits}, "
+            f"stale: {len(stale)}, misses: {len(missing)}"
+        )
+        CACHE_LOOKUPS.labels("price", "hit").inc(hits)
+        CACHE_LOOKUPS.labels("price", "stale").inc(len(stale))
+        CACHE_LOOKUPS.labels("price", "miss").inc(len(missing))
+        if stale:
+            refresh_in_background(f"prices:{','.join(stale)}", lambda: fetch_prices(stale))
+        if missing:
+            # Batch keys are never stored in Redis, so only coalesce within this replica
+            result.update(await singleflight.do(f"prices:{','.join(missing)}", lambda: fetch_prices(missing)))
+
+        for coin_id in result:
+            track_request(f"price:{coin_id}")
+        status = "MISS" if missing else "STALE" if stale else "HIT"
+        set_cache_headers(response, status, 0 if missing else oldest, fresh_ttl)
+        return result
+    except HTTPException:
+        raise
+    except UpstreamRateLimited as e:
+        logger.warning(f"[Container: {HOSTNAME}] Upstream rate limit reached fetching prices for {ids}: {str(e)}")
+        raise upstream_busy(e)
+    except Exception as e:
+        logger.error(f"[Container: {HOSTNAME}] Error fetching prices for {ids}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/coins/list")
+async def get_coins_list(response: Response):
+    """Get id, symbol and name of every coin, for coin-id resolution by clients."""
+    try:
+        cache_key = "coins:list"
+        return await cached_fetch(
+            cache_key,
+            coin_list_ttl(),
+            lambda: fetch_coins_list(cache_key),
+            response,
+            "coin list"
+        )
+    except HTTPException:
+        raise
+    except UpstreamRateLimited as e:
+        logger.warning(f"[Container: {HOSTNAME}] Upstream rate limit reached fetching coin list: {str(e)}")
+        raise upstream_busy(e)
+    except Exception as e:
+        logger.error(f"[Container: {HOSTNAME}] Error fetching coin list: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/historical/{coin_id}")
-async def get_historical_price(coin_id: str, days: int):
-    """Get historical price data."""
+async def get_historical_price(coin_id: str, days: int, response: Response, max_points: Optional[int] = None):
+    """Get historical price data.
+
+    Each coin has one stored series per granularity holding the longest
+    range fetched so far; shorter ranges are sliced from it. Stale series are
+    served while only their missing tail is fetched in the background.
+    With ``max_points`` each field is downsampled to at most that many
+    points, keeping the first, last, lowest and highest ones.
+    """
+    if max_points is not None and max_points < HISTORICAL_MIN_POINTS:
+        raise HTTPException(status_code=400, detail=f"max_points must be at least {HISTORICAL_MIN_POINTS}")
+
+    def respond(series: dict) -> dict:
+        track_request(f"historical:{coin_id}:{days}")
+        sliced = slice_series(series, days)
+        if max_points:
+            sliced = downsample_series(sliced, max_points)
+        return to_market_chart(sliced)
+
     try:
+        cache_key = series_key(coin_id, days)
+        fresh_ttl = historical_ttl(days)
+        description = f"historical data - coin_id: {coin_id}, days: {days}"
+
         if redis_client:
-            cache_key = f"historical:{coin_id}:{days}"
-            cached_data = redis_client.get(cache_key)
-            
+            cached_data = await redis_client.get(cache_key)
+
             if cached_data:
-                logger.info(f"✅ Cache HIT for historical data - coin_id: {coin_id}, days: {days}")
-                return json.loads(cached_data)
-            
-            logger.info(f"❌ Cache MISS for historical data - coin_id: {coin_id}, days: {days}")
-        
-        logger.info(f"Fetching historical data from CoinGecko API - coin_id: {coin_id}, days: {days}")
-        data = coingecko.get_coin_market_chart_by_id(
-            id=coin_id,
-            vs_currency='usd',
-            days=days
+                series, age = decode_series_entry(cached_data)
+                if series["span_days"] >= days:
+                    if age < fresh_ttl:
+                        logger.info(f"[Container: {HOSTNAME}] ✅ Cache HIT for {description}")
+                        CACHE_LOOKUPS.labels("series", "hit").inc()
+                        set_cache_headers(response, "HIT", age, fresh_ttl)
+                        return respond(series)
+
+                    logger.info(f"[Container: {HOSTNAME}] ♻️ Cache STALE for {description}, age: {age:.0f}s - refreshing tail in background")
+                    CACHE_LOOKUPS.labels("series", "stale").inc()
+                    refresh_in_background(cache_key, lambda: refresh_historical(coin_id, cache_key, series, age))
+                    set_cache_headers(response, "STALE", age, fresh_ttl)
+                    return respond(series)
+
+                logger.info(f"[Container: {HOSTNAME}] ❌ Cache MISS for {description}, stored series covers {series['span_days']} days")
+            else:
+                logger.info(f"[Container: {HOSTNAME}] ❌ Cache MISS for {description}")
+            CACHE_LOOKUPS.labels("series", "miss").inc()
+
+        def covering_series(raw: bytes) -> Optional[dict]:
+            # The series stored before the lock holder's fetch may be too short; keep waiting for the new one
+            series = decode_series_entry(raw)[0]
+            return series if series["span_days"] >= days else None
+
+        series = await coalesced_fetch(
+            cache_key,
+            lambda: fetch_historical(coin_id, days, cache_key),
+            decode=covering_series
         )
-        
-        if not data:
-            logger.error(f"No historical data found for coin_id: {coin_id}")
-            raise HTTPException(status_code=404, detail=f"No historical data found for coin: {coin_id}")
-            
-        if redis_client:
-            redis_client.setex(cache_key, 60, json.dumps(data))
-            logger.info(f"Cached historical data for coin_id: {coin_id}, days: {days}")
-            
-        return data
+        if series is None or series["span_days"] < days:
+            # Joined a fetch (or tail refresh) of a shorter range of the same series on this replica
+            series = await fetch_historical(coin_id, days, cache_key)
+        set_cache_headers(response, "MISS", 0, fresh_ttl)
+        return respond(series)
+    except HTTPException:
+        raise
+    except UpstreamRateLimited as e:
+        logger.warning(f"Upstream rate limit reached fetching historical data for {coin_id}: {str(e)}")
+        raise upstream_busy(e)
     except Exception as e:
         logger.error(f"Error fetching historical data for {coin_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,185 @@
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Optional
+from metrics import UPSTREAM_TOKEN_WAIT
+
+logger = logging.getLogger("coingecko_service")
+
+# CoinGecko's limit is per API key, so every replica draws from one bucket
+UPSTREAM_RATE_LIMIT = float(os.getenv("UPSTREAM_RATE_LIMIT", 30))  # calls per minute
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", 10))
+# Tokens background calls (warming, stale refreshes) leave for user cache misses
+UPSTREAM_BACKGROUND_RESERVE = float(os.getenv("UPSTREAM_BACKGROUND_RESERVE", 3))
+# How long a call may queue for a token before it fails
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", 10))
+UPSTREAM_BACKGROUND_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_BACKGROUND_QUEUE_TIMEOUT", 2))
+# Pause after a 429 without Retry-After, doubled on each consecutive one
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", 2))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", 60))
+
+BUCKET_KEY = "ratelimit:upstream"
+BACKOFF_KEY = "ratelimit:upstream:backoff"
+STRIKES_KEY = "ratelimit:upstream:strikes"
+
+PRIORITY_USER = "user"
+PRIORITY_BACKGROUND = "background"
+
+# Priority of upstream calls made in the current task
+upstream_priority = contextvars.ContextVar("upstream_priority", default=PRIORITY_USER)
+
+# Refills the bucket from Redis' clock and takes a token if one is left above
+# the reserve. Returns 0 when a token was taken, otherwise the milliseconds
+# to wait before trying again (the remaining backoff after a 429, if any).
+_TAKE_SCRIPT = """
+local backoff = redis.call("PTTL", KEYS[2])
+if backoff > 0 then
+    return backoff
+end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(bucket[1]) or burst
+local last = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate / 1000)
+local wait = 0
+if tokens >= 1 + reserve then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 + reserve - tokens) * 1000 / rate)
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+class UpstreamRateLimited(Exception):
+    """No upstream token became available before the caller's deadline."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        # Seconds until the bucket was expected to have a token again
+        self.retry_after = retry_after
+
+def background_context() -> contextvars.Context:
+    """A copy of the current context whose upstream calls yield to user traffic."""
+    context = contextvars.copy_context()
+    context.run(upstream_priority.set, PRIORITY_BACKGROUND)
+    return context
+
+class UpstreamRateLimiter:
+    """Token bucket in Redis shared by every replica, taken before each upstream call.
+
+    Callers on a replica queue in FIFO order per priority, so only the head
+    of each queue polls Redis. Background calls wait while user calls are
+    queued and never take the last ``background_reserve`` tokens. A 429
+    pauses all replicas for its Retry-After, or an exponentially growing
+    backoff when upstream does not say.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        rate_per_minute: float,
+        burst: int,
+        background_reserve: float,
+        backoff_base: float,
+        backoff_max: float
+    ):
+        self.redis = redis_client
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.background_reserve = background_reserve
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._take = redis_client.register_script(_TAKE_SCRIPT)
+        self._queues = {PRIORITY_USER: asyncio.Lock(), PRIORITY_BACKGROUND: asyncio.Lock()}
+        self._waiting = {PRIORITY_USER: 0, PRIORITY_BACKGROUND: 0}
+
+        # Counters behind stats()
+        self.acquired = {PRIORITY_USER: 0, PRIORITY_BACKGROUND: 0}
+        self.timeouts = {PRIORITY_USER: 0, PRIORITY_BACKGROUND: 0}
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+        self.redis_errors = 0
+
+    async def acquire(self, priority: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        """Wait for a token, raising UpstreamRateLimited after ``timeout`` seconds."""
+        priority = priority or upstream_priority.get()
+        if timeout is None:
+            timeout = UPSTREAM_QUEUE_TIMEOUT if priority == PRIORITY_USER else UPSTREAM_BACKGROUND_QUEUE_TIMEOUT
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        wait = 1 / self.rate
+        self._waiting[priority] += 1
+        try:
+            async with asyncio.timeout(timeout):
+                async with self._queues[priority]:
+                    while True:
+                        wait = await self._try_take(priority)
+                        if wait == 0:
+                            break
+                        await asyncio.sleep(wait)
+        except TimeoutError:
+            self.timeouts[priority] += 1
+            raise UpstreamRateLimited(
+                f"No upstream token within {timeout:.1f}s ({priority} call)", wait
+            ) from None
+        finally:
+            self._waiting[priority] -= 1
+
+        waited = loop.time() - started
+        UPSTREAM_TOKEN_WAIT.labels(priority).observe(waited)
+        self.acquired[priority] += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    async def _try_take(self, priority: str) -> float:
+        """0 once a token is taken, otherwise seconds to wait before the next try."""
+        reserve = 0
+        if priority == PRIORITY_BACKGROUND:
+            if self._waiting[PRIORITY_USER]:
+                return 1 / self.rate
+            reserve = self.background_reserve
+        try:
+            wait_ms = await self._take(keys=[BUCKET_KEY, BACKOFF_KEY], args=[self.rate, self.burst, reserve])
+        except Exception as e:
+            # An unreachable Redis must not take the upstream down with it
+            self.redis_errors += 1
+            logger.warning(f"Upstream rate limiter unavailable, calling upstream anyway: {str(e)}")
+            return 0
+        return int(wait_ms) / 1000
+
+    async def throttle(self, retry_after: Optional[float] = None) -> float:
+        """Pause upstream calls on every replica after a 429; returns the pause in seconds."""
+        self.throttled += 1
+        try:
+            strikes = await self.redis.incr(STRIKES_KEY)
+            await self.redis.expire(STRIKES_KEY, int(self.backoff_max * 2))
+            delay = retry_after or min(self.backoff_max, self.backoff_base * 2 ** (strikes - 1))
+            await self.redis.set(BACKOFF_KEY, strikes, px=max(1, int(delay * 1000)))
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Could not record upstream backoff: {str(e)}")
+            return 0.0
+        logger.warning(f"Upstream returned 429, pausing upstream calls for {delay:.1f}s (strike {strikes})")
+        return delay
+
+    def stats(self) -> dict:
+        acquired = sum(self.acquired.values())
+        return {
+            "rate_per_minute": self.rate * 60,
+            "burst": self.burst,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "waiting": self._waiting,
+            "avg_wait_ms": self.total_wait / acquired * 1000 if acquired else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+            "throttled": self.throttled,
+            "redis_errors": self.redis_errors,
+        }
@@ -0,0 +1,125 @@
+import math
+from typing import Optional, Tuple
+import numpy as np
+
+DAY_MS = 86_400_000
+
+SERIES_FIELDS = ("prices", "market_caps", "total_volumes")
+
+# A series field is a pair of arrays: int64 millisecond timestamps and float64 values
+EMPTY_FIELD = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+
+def granularity(days: int) -> str:
+    """Point spacing CoinGecko uses for a range: 5-minute for 1 day, hourly up to 90, daily beyond."""
+    if days <= 1:
+        return "5m"
+    if days <= 90:
+        return "hourly"
+    return "daily"
+
+def series_key(coin_id: str, days: int) -> str:
+    """One stored series per coin and granularity; every range of that granularity is sliced from it."""
+    return f"series:{coin_id}:{granularity(days)}"
+
+def _to_field(points: list) -> Tuple[np.ndarray, np.ndarray]:
+    if not points:
+        return EMPTY_FIELD
+    try:
+        array = np.asarray(points, dtype=np.float64)
+    except TypeError:
+        # CoinGecko occasionally reports null market caps or volumes
+        array = np.asarray(
+            [(timestamp, math.nan if value is None else value) for timestamp, value in points],
+            dtype=np.float64
+        )
+    return array[:, 0].astype(np.int64), array[:, 1]
+
+def make_series(data: dict, days: int) -> dict:
+    """Stored form of a ``market_chart`` response covering ``days`` days."""
+    return {"span_days": days, **{field: _to_field(data.get(field)) for field in SERIES_FIELDS}}
+
+def to_market_chart(series: dict) -> dict:
+    """Shape a series like CoinGecko's ``market_chart`` response, with ``[ts, value]`` pairs."""
+    chart = {}
+    for field in SERIES_FIELDS:
+        timestamps, values = series[field]
+        value_list = values.tolist()
+        if np.isnan(values).any():
+            value_list = [None if math.isnan(value) else value for value in value_list]
+        chart[field] = [[timestamp, value] for timestamp, value in zip(timestamps.tolist(), value_list)]
+    return chart
+
+def slice_series(series: dict, days: int) -> dict:
+    """The last ``days`` days of a stored series."""
+    last = series["prices"][0]
+    if not len(last):
+        return {field: series[field] for field in SERIES_FIELDS}
+    cutoff = last[-1] - days * DAY_MS
+    sliced = {}
+    for field in SERIES_FIELDS:
+        timestamps, values = series[field]
+        start = np.searchsorted(timestamps, cutoff, side="left")
+        sliced[field] = (timestamps[start:], values[start:])
+    return sliced
+
+def downsample(timestamps: np.ndarray, values: np.ndarray, max_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Reduce a field to at most ``max_points`` points while keeping its shape.
+
+    The first and last points are kept and the rest is split into equal
+    buckets, each contributing its minimum and maximum, so spikes and dips
+    survive. ``max_points`` must be at least 4.
+    """
+    count = len(values)
+    if count <= max_points:
+        return timestamps, values
+    inner = values[1:-1]
+    buckets = (max_points - 2) // 2
+    size = -(-len(inner) // buckets)
+    rows = -(-len(inner) // size)
+    padding = rows * size - len(inner)
+    missing = np.isnan(inner)
+    lows = np.pad(np.where(missing, np.inf, inner), (0, padding), constant_values=np.inf).reshape(rows, size)
+    highs = np.pad(np.where(missing, -np.inf, inner), (0, padding), constant_values=-np.inf).reshape(rows, size)
+    offsets = np.arange(rows) * size + 1
+    picks = np.unique(np.concatenate((
+        [0], offsets + lows.argmin(axis=1), offsets + highs.argmax(axis=1), [count - 1]
+    )))
+    return timestamps[picks], values[picks]
+
+def downsample_series(series: dict, max_points: int) -> dict:
+    """Downsample every field of a series independently."""
+    return {field: downsample(*series[field], max_points) for field in SERIES_FIELDS}
+
+def merge_series(base: dict, update: dict) -> dict:
+    """Overlay ``update`` on ``base``.
+
+    Points of ``update`` replace those of ``base`` from its first timestamp
+    on, so a freshly fetched tail also replaces the previous "now" point. The
+    result keeps the longer of the two spans.
+    """
+    span_days = max(base["span_days"], update["span_days"])
+    merged = {}
+    for field in SERIES_FIELDS:
+        base_timestamps, base_values = base[field]
+        timestamps, values = update[field]
+        end = np.searchsorted(base_timestamps, timestamps[0]) if len(timestamps) else len(base_timestamps)
+        merged[field] = (
+            np.concatenate((base_timestamps[:end], timestamps)),
+            np.concatenate((base_values[:end], values))
+        )
+    return {"span_days": span_days, **slice_series(merged, span_days)}
+
+def tail_request(span_days: int, age: float) -> Optional[Tuple[int, Optional[str]]]:
+    """Upstream ``(days, interval)`` that covers the ``age`` seconds a stored series is missing.
+
+    The request keeps the series' granularity and overlaps it by a day.
+    Returns None when the tail would be as long as the series itself.
+    """
+    days = math.ceil(age / 86400) + 1
+    bucket = granularity(span_days)
+    if bucket == "hourly":
+        # Shorter ranges would come back with 5-minute points
+        days = max(days, 2)
+    if days >= span_days:
+        return None
+    return days, "daily" if bucket == "daily" else None
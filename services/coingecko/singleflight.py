@@ -0,0 +1,59 @@
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+
+# Deletes the lock only if we still own it, so an expired lock taken over by
+# another replica is never released by the previous owner
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight call.
+
+    The first caller for a key starts the call as a task; later callers await
+    the same task. The task is shielded so a cancelled caller (e.g. a client
+    disconnect) does not cancel the call for everyone else.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        self._calls.pop(key, None)
+        # Mark the exception as retrieved when every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+class RedisLock:
+    """Best-effort lock shared by all replicas, held for at most ``ttl`` seconds."""
+
+    def __init__(self, redis_client, name: str, ttl: float):
+        self.redis = redis_client
+        self.name = name
+        self.ttl_ms = int(ttl * 1000)
+        self.token = uuid.uuid4().hex
+
+    async def acquire(self) -> bool:
+        return bool(await self.redis.set(self.name, self.token, nx=True, px=self.ttl_ms))
+
+    async def release(self) -> None:
+        await self.redis.eval(_RELEASE_SCRIPT, 1, self.name, self.token)
+
+    async def held(self) -> bool:
+        """Whether anyone (this or another replica) currently holds the lock."""
+        return bool(await self.redis.exists(self.name))
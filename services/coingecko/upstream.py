@@ -0,0 +1,97 @@
+import logging
+import os
+import time
+from typing import Optional
+import httpx
+from metrics import UPSTREAM_DURATION
+from ratelimit import UpstreamRateLimited
+
+logger = logging.getLogger("coingecko_service")
+
+# Public CoinGecko API; override for the pro endpoint or a local mock
+COINGECKO_API_URL = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3")
+
+# Pool limits and per-phase timeouts for upstream calls
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 50))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", 10))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 5))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", 15))
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Cluster-wide token bucket (ratelimit.UpstreamRateLimiter), set in the app lifespan when Redis is up
+rate_limiter = None
+
+async def start_client() -> None:
+    """Open the pooled upstream client; called from the app lifespan."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=COINGECKO_API_URL,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(
+                UPSTREAM_READ_TIMEOUT,
+                connect=UPSTREAM_CONNECT_TIMEOUT,
+            ),
+            headers={"Accept": "application/json"},
+        )
+        logger.info(f"Upstream client initialized for {COINGECKO_API_URL}")
+
+async def close_client() -> None:
+    """Close the upstream client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+async def _get(endpoint: str, path: str, params: dict) -> dict:
+    """GET ``path`` upstream; ``endpoint`` names it in metrics without the coin id."""
+    if _client is None:
+        await start_client()
+    if rate_limiter:
+        await rate_limiter.acquire()
+    started = time.perf_counter()
+    status = "error"
+    try:
+        response = await _client.get(path, params=params)
+        status = str(response.status_code)
+    finally:
+        UPSTREAM_DURATION.labels(endpoint, status).observe(time.perf_counter() - started)
+    if response.status_code == 429:
+        pause = await rate_limiter.throttle(_retry_after(response)) if rate_limiter else _retry_after(response)
+        raise UpstreamRateLimited(f"CoinGecko returned 429 for {endpoint}", pause or 0)
+    response.raise_for_status()
+    return response.json()
+
+async def get_price(ids: str) -> dict:
+    """Spot price, market cap and 24h change in USD for comma-separated ids."""
+    return await _get("simple_price", "/simple/price", {
+        "ids": ids,
+        "vs_currencies": "usd",
+        "include_market_cap": "true",
+        "include_24hr_change": "true",
+    })
+
+async def get_coin_market_chart_by_id(coin_id: str, days: int, interval: Optional[str] = None) -> dict:
+    """Price, market cap and volume series in USD for the last ``days`` days.
+
+    ``interval="daily"`` forces daily points for ranges CoinGecko would
+    otherwise return hourly.
+    """
+    params = {"vs_currency": "usd", "days": days}
+    if interval:
+        params["interval"] = interval
+    return await _get("market_chart", f"/coins/{coin_id}/market_chart", params)
+
+async def get_coins_list() -> list:
+    """Every coin CoinGecko knows, as ``{"id", "symbol", "name"}`` dicts."""
+    return await _get("coins_list", "/coins/list", {})
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+import numpy as np
+from singleflight import RedisLock
+
+logger = logging.getLogger("coingecko_service")
+
+# Every replica publishes its hottest keys under HOT_KEYS_PREFIX:{replica};
+# the leader of a cycle merges them into HOT_KEYS
+HOT_KEYS = "warm:hot"
+HOT_KEYS_PREFIX = "warm:hot"
+REPLICAS_KEY = "warm:replicas"
+LEADER_LOCK = "lock:warmer"
+
+class DecayingSketch:
+    """Count-min sketch of request keys whose counts fade over time.
+
+    ``decay`` multiplies every counter by a factor, so the estimates follow
+    recent traffic. The ``k`` keys with the highest estimates are tracked
+    alongside; the sketch itself needs no memory per key.
+    """
+
+    def __init__(self, width: int, depth: int, k: int):
+        self.width = width
+        self.depth = depth
+        self.k = k
+        self.table = np.zeros((depth, width), dtype=np.float64)
+        self._rows = np.arange(depth)
+        self.top: Dict[str, float] = {}
+
+    def _columns(self, key: str) -> np.ndarray:
+        digest = hashlib.blake2b(key.encode(), digest_size=8 * self.depth).digest()
+        return np.frombuffer(digest, dtype="<u8") % self.width
+
+    def estimate(self, key: str) -> float:
+        return float(self.table[self._rows, self._columns(key)].min())
+
+    def add(self, key: str, count: float = 1.0) -> float:
+        """Count ``key`` and return its new estimate."""
+        columns = self._columns(key)
+        cells = self.table[self._rows, columns]
+        # Conservative update: only raise the counters that are below the new estimate
+        estimate = float(cells.min()) + count
+        self.table[self._rows, columns] = np.maximum(cells, estimate)
+        self._track(key, estimate)
+        return estimate
+
+    def _track(self, key: str, estimate: float) -> None:
+        if key in self.top or len(self.top) < self.k:
+            self.top[key] = estimate
+            return
+        coldest = min(self.top, key=self.top.get)
+        if estimate > self.top[coldest]:
+            del self.top[coldest]
+            self.top[key] = estimate
+
+    def decay(self, factor: float) -> None:
+        self.table *= factor
+        self.top = {key: estimate * factor for key, estimate in self.top.items()}
+
+class CacheWarmer:
+    """Refresh the most requested cache entries before they expire.
+
+    Requests are counted per replica in a decaying sketch. Every
+    ``interval`` seconds each replica publishes its top keys to Redis, and
+    the one replica that takes the cycle's leader lock merges all of them
+    and hands the hottest keys to ``refresh``, which returns counters for
+    ``stats()``.
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[List[Tuple[str, float]]], Awaitable[Dict[str, int]]],
+        interval: float,
+        top_k: int,
+        decay: float,
+        min_score: float,
+        sketch_width: int,
+        sketch_depth: int
+    ):
+        self.refresh = refresh
+        self.interval = interval
+        self.top_k = top_k
+        self.decay = decay
+        self.min_score = min_score
+        self.sketch = DecayingSketch(sketch_width, sketch_depth, top_k)
+
+        # Counters behind stats()
+        self.cycles = 0
+        self.led_cycles = 0
+        self.failed_cycles = 0
+        self.refreshed: Dict[str, int] = {}
+
+    def record(self, key: str) -> None:
+        self.sketch.add(key)
+
+    async def run(self, redis_client, replica: str) -> None:
+        """Warm the cache every ``interval`` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.cycle(redis_client, replica)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_cycles += 1
+                logger.error(f"[Container: {replica}] Cache warming cycle failed: {str(e)}")
+
+    async def cycle(self, redis_client, replica: str) -> None:
+        self.cycles += 1
+        await self.publish(redis_client, replica)
+        self.sketch.decay(self.decay)
+
+        # The lock is left to expire so no other replica leads this cycle
+        if not await RedisLock(redis_client, LEADER_LOCK, self.interval).acquire():
+            return
+        self.led_cycles += 1
+        hot = await self.merge(redis_client)
+        if not hot:
+            return
+        counts = await self.refresh(hot)
+        for name, count in counts.items():
+            self.refreshed[name] = self.refreshed.get(name, 0) + count
+        logger.info(f"[Container: {replica}] Cache warming cycle over {len(hot)} hot keys: {counts}")
+
+    async def publish(self, redis_client, replica: str) -> None:
+        """Replace this replica's published top keys with the current estimates.
+
+        All of them: a key below ``min_score`` here may pass it once summed
+        with other replicas, so the threshold applies only in ``merge``.
+        """
+        key = f"{HOT_KEYS_PREFIX}:{replica}"
+        top = dict(self.sketch.top)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if top:
+                pipe.zadd(key, top)
+            # A replica that stops publishing drops out after a few cycles
+            pipe.expire(key, max(1, int(self.interval * 3)))
+            pipe.zadd(REPLICAS_KEY, {replica: time.time()})
+            await pipe.execute()
+
+    async def merge(self, redis_client) -> List[Tuple[str, float]]:
+        """Sum the top keys of every live replica; the hottest first."""
+        await redis_client.zremrangebyscore(REPLICAS_KEY, 0, time.time() - self.interval * 3)
+        replicas = await redis_client.zrange(REPLICAS_KEY, 0, -1)
+        if not replicas:
+            return []
+        await redis_client.zunionstore(HOT_KEYS, [f"{HOT_KEYS_PREFIX}:{replica.decode()}" for replica in replicas])
+        hot = await redis_client.zrevrangebyscore(
+            HOT_KEYS, "+inf", self.min_score, start=0, num=self.top_k, withscores=True
+        )
+        return [(key.decode(), score) for key, score in hot]
+
+    def stats(self) -> dict:
+        return {
+            "interval_s": self.interval,
+            "tracked_keys": len(self.sketch.top),
+            "cycles": self.cycles,
+            "led_cycles": self.led_cycles,
+            "failed_cycles": self.failed_cycles,
+            "refreshed": self.refreshed,
+        }